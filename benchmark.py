@@ -0,0 +1,237 @@
+from pagerank_script1 import *
+from pagerank_script2 import *
+from pagerank_script3 import *
+
+import csv
+import json
+import time
+import tracemalloc
+
+from observers import TimingObserver
+
+# every engine takes (web, d, stopvalue, built) and returns (ranking, iterations),
+# where iterations is None for methods without iterations, and built is a dictionary
+# with the structures of build_structures the engine needs (see NEEDS), which are
+# built once per web and d outside the timed runs, so all engines are timed solving
+ENGINES = dict()
+NEEDS = dict()
+
+def register_engine(name, needs=()):
+    ''' decorator adding a PageRank engine to ENGINES under name, needing the structures needs '''
+    def register(engine):
+        ENGINES[name] = engine
+        NEEDS[name] = needs
+        return engine
+    return register
+
+@register_engine('eigenvector', needs=("operator", "dense"))
+def eigenvector_engine(web, d, stopvalue, built):
+    return eigenvector_pagerank(web, d, operator=built["operator"]), None
+
+@register_engine('recursive', needs=("fixed",))
+def recursive_engine(web, d, stopvalue, built):
+    # the dict method lets the sinks link to all pages, so it gets its own copy of web
+    fixed, index = built["fixed"]
+    return recursive_pagerank(fixed, stopvalue, d=d, index=index)
+
+@register_engine('recursive_vectorized', needs=("index",))
+def recursive_vectorized_engine(web, d, stopvalue, built):
+    return recursive_pagerank(web, stopvalue, d=d, method="vectorized", index=built["index"])
+
+@register_engine('gauss_seidel', needs=("index",))
+def gauss_seidel_engine(web, d, stopvalue, built):
+    return recursive_pagerank(web, stopvalue, d=d, method="gauss-seidel", index=built["index"])
+
+@register_engine('adaptive', needs=("index",))
+def adaptive_engine(web, d, stopvalue, built):
+    return recursive_pagerank(web, stopvalue, d=d, method="adaptive", index=built["index"])
+
+@register_engine('parallel', needs=("index",))
+def parallel_engine(web, d, stopvalue, built):
+    return recursive_pagerank(web, stopvalue, d=d, method="parallel", index=built["index"])
+
+@register_engine('distributed', needs=("index",))
+def distributed_engine(web, d, stopvalue, built):
+    return distributed_pagerank(web, stopvalue, d=d, index=built["index"])
+
+@register_engine('sparse', needs=("operator",))
+def sparse_engine(web, d, stopvalue, built):
+    timing = TimingObserver()
+    ranking = sparse_pagerank(web, d, stopvalue, operator=built["operator"], observer=timing)
+    return ranking, timing.iterations[-1][0]
+
+@register_engine('matrix_vector', needs=("operator", "dense"))
+def matrix_vector_engine(web, d, stopvalue, built):
+    # the same number of products as the power iteration needs to reach stopvalue
+    power = math.ceil(math.log(stopvalue)/math.log(d))
+    return matrix_pagerank(web, power, d, method="vector", operator=built["operator"]), power
+
+@register_engine('random_surf_vectorized', needs=("operator",))
+def random_surf_engine(web, d, stopvalue, built):
+    n = 1000*len(web)
+    operator = built["operator"]
+    links = (operator.indptr, operator.indices, operator.outdegree)
+    return random_surf_vectorized(web, n, d, seed=0, links=links), n
+
+
+def build_structures(web, d, needs, measure_memory=True):
+    '''
+    Builds the structures in needs for web and d:
+        "index":    WebIndex of web
+        "fixed":    (copy of web where the sinks link to all pages, its WebIndex)
+        "operator": GoogleMatrix of web and d
+        "dense":    the dense matrix of the operator (built into it, so needs "operator")
+    Output: (built, times, memory), dictionaries from the names in needs to the
+            structure, the seconds and the peak bytes traced while building it
+            (memory is empty if measure_memory is False)
+    '''
+    builders = {
+        "index": lambda: WebIndex(web),
+        "fixed": lambda: build_fixed(web),
+        "operator": lambda: GoogleMatrix(web, d),
+        "dense": lambda: built["operator"].dense(),
+    }
+    built, times, memory = dict(), dict(), dict()
+    # the operator goes before the dense matrix it holds
+    for name in sorted(needs, key=list(builders).index):
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            built[name] = builders[name]()
+            times[name] = time.perf_counter() - start
+            if measure_memory:
+                memory[name] = tracemalloc.get_traced_memory()[1]
+        finally:
+            if measure_memory:
+                tracemalloc.stop()
+    return built, times, memory
+
+def build_fixed(web):
+    ''' returns a copy of web where the sinks link to all pages, and its WebIndex '''
+    fixed = {page: set(links) for page, links in web.items()}
+    fix_zero_columns(fixed)
+    return fixed, WebIndex(fixed)
+
+def time_engine(engine, web, d, stopvalue, built, warmup, repeats):
+    '''
+    runs engine warmup times without timing, then repeats times with timing
+    Output: (ranking, iterations, times) of the last run, times is the list of wall times
+    '''
+    for _ in range(warmup):
+        engine(web, d, stopvalue, built)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ranking, iterations = engine(web, d, stopvalue, built)
+        times.append(time.perf_counter() - start)
+    return ranking, iterations, times
+
+def peak_memory(engine, web, d, stopvalue, built):
+    '''
+    returns the peak memory in bytes allocated during one (untimed) run of engine, as
+    traced by tracemalloc in this process: python objects and numpy arrays, but not the
+    memory of worker processes (distributed) nor the structures in built
+    '''
+    tracemalloc.start()
+    try:
+        engine(web, d, stopvalue, built)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def run_benchmarks(sizes, degrees, dampings, engines=None, warmup=1, repeats=5,
+                   stopvalue=1e-8, seed=0, measure_memory=True):
+    '''
+    Benchmarks the engines on a random web (from fast_make_web) for every combination
+    of number of pages in sizes, maximum number of links in degrees and damping factor
+    in dampings. The web is kept sparse, the sinks are not linked to all pages.
+    The structures the engines need are built once per web and d (see build_structures),
+    and every engine is run warmup times and then timed repeats times, so the times are
+    of solving only and the build time of the structures is reported separately.
+    The error is the largest difference to a reference ranking from sparse_pagerank
+    with stopvalue 1e-14.
+    Input: engines is a list of names in ENGINES, default all of them
+    Output: list of dictionaries, one for every engine and web, with the median and
+            inter quartile range of the wall times, the iterations, the error, the
+            seconds to build the structures the engine needs, and the peak memory traced
+            by tracemalloc during a run and while building the structures (see write_results)
+    '''
+    if engines is None:
+        engines = list(ENGINES)
+    needs = {structure for name in engines for structure in NEEDS[name]} | {"operator"}
+
+    results = []
+    for nodes in sizes:
+        for connections in degrees:
+            web = fast_make_web(nodes, connections, seed=seed)
+
+            for d in dampings:
+                print(f'building: {nodes} pages, {connections} links, d={d}')
+                built, build_times, build_memory = build_structures(web, d, needs, measure_memory)
+                reference = sparse_pagerank(web, d, 1e-14, operator=built["operator"])
+                for name in engines:
+                    print(f'{name}: {nodes} pages, {connections} links, d={d}')
+                    engine = ENGINES[name]
+                    ranking, iterations, times = time_engine(engine, web, d, stopvalue, built, warmup, repeats)
+                    q1, median, q3 = np.percentile(times, [25, 50, 75])
+
+                    results.append({
+                        'engine': name,
+                        'nodes': nodes,
+                        'connections': connections,
+                        'd': d,
+                        'repeats': repeats,
+                        'median_time': median,
+                        'iqr_time': q3 - q1,
+                        'min_time': min(times),
+                        'build_time': sum(build_times[structure] for structure in NEEDS[name]),
+                        'iterations': iterations,
+                        'error': max(abs(ranking[page] - reference[page]) for page in web),
+                        'peak_traced_mb': peak_memory(engine, web, d, stopvalue, built)/2**20 if measure_memory else None,
+                        'build_traced_mb': sum(build_memory[structure] for structure in NEEDS[name])/2**20 if measure_memory else None,
+                    })
+                # let the structures of this web and d go before building the next ones
+                del built
+    return results
+
+def write_results(results, filename):
+    '''
+    writes the results of run_benchmarks as csv or json, depending on the extension of filename
+    The memory columns are the peaks traced by tracemalloc (python objects and numpy
+    arrays of the benchmark process), not the peak RSS: they miss the memory of the worker
+    processes of distributed and what is not allocated through python, like BLAS buffers.
+    '''
+    with open(filename, 'w', newline='') as file:
+        if filename.endswith('.json'):
+            json.dump(results, file, indent=2, default=float)
+        else:
+            writer = csv.DictWriter(file, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+def write_times(results, filename, d):
+    '''
+    writes the median times of the results for the damping factor d with a row for every
+    web and a column for every engine, like timecalc.py, so plot.py can plot it
+    '''
+    engines = list(dict.fromkeys(result['engine'] for result in results))
+    rows = dict()
+    for result in results:
+        if result['d'] == d:
+            row = rows.setdefault((result['nodes'], result['connections']), dict())
+            row[result['engine']] = result['median_time']
+
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['nodes', 'connections'] + engines)
+        for (nodes, connections), row in rows.items():
+            writer.writerow([nodes, connections] + [row.get(engine, '') for engine in engines])
+
+if __name__ == '__main__':
+    results = run_benchmarks(sizes=[100, 500, 1000, 2000], degrees=[10], dampings=[0.85])
+    write_results(results, 'benchmark.json')
+    write_results(results, 'benchmark.csv')
+    write_times(results, 'benchmark_times.csv', 0.85)
@@ -29,6 +29,13 @@ def run():
     matrix_pagerank_csv(web, true_ranking, max_iterations, tolerance, writer,d)
     file.close()
 
+    EXTRAPOLATED_FILENAME = 'extrapolated.csv'
+    file = open(EXTRAPOLATED_FILENAME, 'w', newline='')
+    writer = csv.writer(file)
+
+    convergence_extrapolated_pagerank(web, true_ranking, tolerance, max_iterations, writer, d)
+    file.close()
+
 if __name__ == '__main__':
     run()
 
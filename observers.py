@@ -0,0 +1,147 @@
+"""
+Observers of the iterations of the PageRank solvers.
+
+Solvers like recursive_pagerank take an optional observer and call
+    observer.phase(name, seconds)
+when a phase before the iterations, like "build" of the link structure, is done, and
+    observer.iteration(iteration, residual, elapsed, ranks)
+after every iteration, where residual is the largest change of a pagerank in the
+iteration, elapsed is the time in seconds spent iterating so far (not counting the
+observers) and ranks is a numpy vector of the current pageranks in the order of web.
+When iteration returns True the solver stops.
+Without an observer the solvers do not measure anything.
+"""
+import numpy as np
+
+NORMS = ("relative", "absolute", "l1", "linf")
+
+class Observer:
+    ''' Observer that does nothing, the base of the other observers '''
+    def phase(self, name, seconds):
+        pass
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        return False
+
+class ObserverGroup(Observer):
+    ''' Passes every event on to all observers, and stops when one of them says so '''
+    def __init__(self, *observers):
+        self.observers = observers
+
+    def phase(self, name, seconds):
+        for observer in self.observers:
+            observer.phase(name, seconds)
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        stop = False
+        for observer in self.observers:
+            stop = observer.iteration(iteration, residual, elapsed, ranks) or stop
+        return stop
+
+class TimingObserver(Observer):
+    ''' Records the phase timings and the residual and elapsed time of every iteration '''
+    def __init__(self):
+        self.phases = dict()
+        self.iterations = [] # (iteration, residual, elapsed)
+
+    def phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        self.iterations.append((iteration, residual, elapsed))
+        return False
+
+    def iterate_time(self):
+        ''' seconds spent iterating '''
+        if len(self.iterations) == 0:
+            return 0.0
+        return self.iterations[-1][2]
+
+    def total_time(self):
+        ''' seconds spent in the phases and iterating '''
+        return sum(self.phases.values()) + self.iterate_time()
+
+class ConvergenceCheck:
+    '''
+    Checks whether pageranks are within tolerance of a known ranking, working on
+    vectors allocated once, so a check costs a few vectorized passes over N entries.
+    true_ranking is a dictionary of pageranks and pages the list of pages in the order
+    of the vectors checked, the solvers use list(web.keys()). norm is one of
+        "relative": every |rank - true| <= tolerance*max(|rank|, |true|), like math.isclose
+        "absolute": every |rank - true| <= tolerance
+        "l1":       sum |rank - true| <= tolerance*sum |true|
+        "linf":     max |rank - true| <= tolerance*max |true|
+    '''
+    def __init__(self, true_ranking, pages, tolerance, norm="relative"):
+        if norm not in NORMS:
+            raise Exception(f'unknown norm {norm}')
+        # looked up by page once, so true_ranking can be in any order
+        self.true_vec = np.array([true_ranking[page] for page in pages], dtype=float)
+        self.tolerance = tolerance
+        self.norm = norm
+
+        N = len(self.true_vec)
+        self.abs_true = np.abs(self.true_vec)
+        self.difference = np.empty(N) # |ranks - true_vec| of the last check
+        self.scale = np.empty(N)
+        self.within = np.empty(N, dtype=bool)
+        if norm == "l1":
+            self.bound = tolerance*self.abs_true.sum()
+        elif norm == "linf":
+            self.bound = tolerance*self.abs_true.max(initial=0)
+        else:
+            self.bound = tolerance
+
+    def __call__(self, ranks):
+        ''' True if ranks (a numpy vector) are within tolerance of the true ranking '''
+        np.subtract(ranks, self.true_vec, out=self.difference)
+        np.abs(self.difference, out=self.difference)
+
+        if self.norm == "relative":
+            np.abs(ranks, out=self.scale)
+            np.maximum(self.scale, self.abs_true, out=self.scale)
+            self.scale *= self.tolerance
+            np.less_equal(self.difference, self.scale, out=self.within)
+            return bool(self.within.all())
+        if self.norm == "l1":
+            return bool(self.difference.sum() <= self.bound)
+        return bool(self.error() <= self.bound)
+
+    def error(self):
+        ''' the max norm error of the last check '''
+        return self.difference.max(initial=0)
+
+class ConvergenceObserver(Observer):
+    '''
+    Compares the pageranks with a known ranking after every iteration, and stops the
+    solver once they are within tolerance of true_ranking, see ConvergenceCheck for norm.
+    If writer (a csv writer) is given, the max norm error of every iteration is written to it.
+    '''
+    def __init__(self, true_ranking, pages, tolerance, writer=None, norm="relative"):
+        self.check = ConvergenceCheck(true_ranking, pages, tolerance, norm)
+        self.writer = writer
+        self.converged = False
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        self.converged = self.check(ranks)
+        if self.writer is not None:
+            self.writer.writerow([self.check.error()])
+        return self.converged
+
+class TimerObserver(Observer):
+    '''
+    Pauses a timer (with start and stop methods, like Timer in timecalc.py) while
+    observer handles the iteration, so checking convergence is not timed.
+    '''
+    def __init__(self, timer, observer):
+        self.timer = timer
+        self.observer = observer
+
+    def phase(self, name, seconds):
+        self.observer.phase(name, seconds)
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        self.timer.stop()
+        stop = self.observer.iteration(iteration, residual, elapsed, ranks)
+        self.timer.start()
+        return stop
@@ -2,6 +2,11 @@
 import numpy as np
 import random
 import math
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+
+from observers import ConvergenceCheck
 ##########################  Helper Functions ################
 def make_web(n,k,kmin=0):
     """
@@ -19,6 +24,98 @@ def make_web(n,k,kmin=0):
         web[j] = set(np.random.choice(keys[keys!=j],numlinks,replace=False)) #chose links from web-{j}
     return web
 
+def fast_make_web(n,k,kmin=0,seed=None,model="uniform",exponent=2.1,csr=False):
+    """
+    Vectorized version of make_web: all numbers of links are drawn at once and all links
+    are sampled in bulk, links to the page itself and repeated links are thrown away and
+    drawn again until every page has its number of links.
+    Input: n and k are non-negative integers, every page links to between kmin and k pages
+           seed is an optional seed for the random generator
+           model is "uniform" for the same distribution as make_web,
+           "powerlaw" for power law distributed numbers of links (with the given exponent)
+           to pages chosen uniformly, or "preferential" for power law numbers of links to
+           pages chosen with power law weights, so a few pages get most inbound links as
+           in preferential attachment (a static, vectorizable variant of it, which needs
+           an exponent larger than 1)
+           csr is False to return a dictionary as make_web, True for the CSR form
+    Output: web is a dictionary with n keys as in make_web, or if csr is True
+            (indptr, indices, outdegree) as in the output of "sparse_link_matrix" for the
+            pages 0, ..., n-1
+    """
+    assert(k<n)
+    rng = np.random.default_rng(seed)
+
+    if model == "uniform":
+        degrees = rng.integers(kmin, k+1, size=n)
+    elif model in ("powerlaw", "preferential"):
+        numbers = np.arange(kmin, k+1)
+        weights = (numbers + 1.0)**(-exponent)
+        degrees = rng.choice(numbers, size=n, p=weights/weights.sum())
+    else:
+        raise Exception(f'unknown model {model}')
+
+    if model == "preferential":
+        if exponent <= 1:
+            raise Exception('the exponent of the preferential model must be larger than 1')
+        # the expected number of inbound links of a page follows a power law
+        popularity = rng.permutation(np.arange(1, n+1)**(-1/(exponent-1)))
+        popularity = popularity/popularity.sum()
+
+    # links are stored as the sorted unique keys source*n+target
+    keys = np.empty(0, dtype=np.int64)
+    missing = degrees
+    while missing.sum() > 0:
+        sources = np.repeat(np.arange(n), missing)
+        if model == "preferential":
+            targets = rng.choice(n, size=len(sources), p=popularity)
+        else:
+            # draw from the n-1 other pages by skipping the source
+            targets = rng.integers(n-1, size=len(sources))
+            targets += targets >= sources
+        new_keys = sources*n + targets
+        keys = np.concatenate([keys, new_keys[targets != sources]])
+        keys.sort()
+        if len(keys) > 0:
+            keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+        missing = degrees - np.bincount(keys // n, minlength=n)
+
+    indptr = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = keys % n
+    if csr:
+        return indptr, indices, degrees.astype(np.int64)
+
+    web=dict()
+    for j in range(n):
+        web[j] = set(indices[indptr[j]:indptr[j+1]].tolist())
+    return web
+
+def sparse_link_matrix(web,pagelist):
+    """
+    Create the link structure of web in compressed sparse row (CSR) form
+    Input: web is a dictionary whose keys are contained in the list pagelist,
+           pagelist is just a list of the keys (to give the keys and ordering)
+    Output: (indptr, indices, outdegree) where page pagelist[j] links to the pages
+          with positions indices[indptr[j]:indptr[j+1]] and outdegree[j] is the
+          number of those links. Unlike modified_link_matrix the web is not changed,
+          sinks simply get outdegree 0, and the damping and teleport terms are left
+          to the caller (sparse_google_product, vectorized_surf_step).
+          Memory is O(N+E) instead of O(N^2).
+    """
+    position = {page: j for j, page in enumerate(pagelist)}
+    N = len(pagelist)
+
+    outdegree = np.zeros(N, dtype=np.int64)
+    indices = []
+    for j, page in enumerate(pagelist):
+        outlinks = web[page]
+        outdegree[j] = len(outlinks)
+        indices.extend(position[q] for q in outlinks)
+
+    indptr = np.zeros(N+1, dtype=np.int64)
+    np.cumsum(outdegree, out=indptr[1:])
+    return indptr, np.array(indices, dtype=np.int64), outdegree
+
 def surf_step(web, page, d=0.85):
     """
     Return a probability distribution over which page to visit next,
@@ -115,6 +212,237 @@ def random_surf(web,n,d=0.85):
 
     return ranking
 
+def vectorized_surf_step(indptr, indices, outdegree, pages, rng, d=0.85):
+    """
+    Take one surf_step for many independent surfers at once in O(1) per surfer.
+    Input: indptr, indices and outdegree are as in the output of "sparse_link_matrix",
+           pages is a numpy vector with the current page number of every surfer,
+           rng is a numpy Generator and d is the damping factor
+
+    - A surfer on a sink jumps to any page at random
+    - Otherwise:
+          With probability `d`, it follows a random outlink of its page,
+          With probability `1 - d`, it jumps to a random page from the whole web.
+    Output: numpy vector with the next page number of every surfer
+    """
+    N = len(outdegree)
+    degrees = outdegree[pages]
+    follow = (rng.random(len(pages)) < d) & (degrees > 0)
+
+    # everyone jumps, then the surfers that follow a link overwrite their jump
+    new_pages = rng.integers(N, size=len(pages))
+    picks = (rng.random(np.count_nonzero(follow)) * degrees[follow]).astype(np.int64)
+    new_pages[follow] = indices[indptr[pages[follow]] + picks]
+    return new_pages
+
+def burn_in_steps(d=0.85, epsilon=1e-6):
+    """
+    Return the number of steps after which a surfer's page is distributed as the
+    pagerank up to epsilon (in total variation), from any start: every step jumps
+    to a random page with probability at least 1-d, so the start is forgotten
+    except with probability d**steps.
+    """
+    if d <= 0:
+        return 0
+    if d >= 1:
+        raise Exception('the surfers never forget their start with d >= 1')
+    return math.ceil(math.log(epsilon)/math.log(d))
+
+def surf_visits(indptr, indices, outdegree, n, rng, d=0.85, walkers=10000):
+    """
+    Count the pages visited by `walkers` surfers moved together by vectorized_surf_step
+    until `n` pages are sampled. Every surfer first walks burn_in_steps(d) steps without
+    counting, so the samples do not depend on the uniform start, and the number of
+    surfers is capped at n // burn_in_steps(d) so this costs at most n more steps.
+    Input: indptr, indices and outdegree are as in the output of "sparse_link_matrix",
+           n is an integer, the number of pages sampled, rng is a numpy Generator,
+           d is the damping factor, walkers is the number of surfers that walk in parallel
+    Output: numpy vector with the number of visits of every page number, summing to n
+    """
+    N = len(outdegree)
+    burn_in = burn_in_steps(d)
+    walkers = max(1, min(walkers, n // max(burn_in, 1)))
+    steps, rest = divmod(n, walkers)
+
+    # the visited pages are collected in a block and counted with bincount when it is full
+    visits = np.zeros(N, dtype=np.int64)
+    block = np.empty((max(1, 2**20 // walkers), walkers), dtype=np.int64)
+    row = 0
+
+    # every surfer starts on a random page and walks until it has forgotten where
+    current = rng.integers(N, size=walkers)
+    for step in range(burn_in):
+        current = vectorized_surf_step(indptr, indices, outdegree, current, rng, d)
+
+    for step in range(steps):
+        block[row] = current
+        row += 1
+        if row == len(block):
+            visits += np.bincount(block.ravel(), minlength=N)
+            row = 0
+        current = vectorized_surf_step(indptr, indices, outdegree, current, rng, d)
+    visits += np.bincount(block[:row].ravel(), minlength=N)
+    visits += np.bincount(current[:rest], minlength=N)
+    return visits
+
+def random_surf_vectorized(web, n, d=0.85, walkers=10000, seed=None, links=None):
+    """
+    Return PageRank values for each page by sampling `n` pages, like random_surf,
+    but with `walkers` independent surfers moved together by vectorized_surf_step.
+    Input: web is a dictionary of webpages and links, 
+           n is an integer, the number of pages sampled in the simulation
+           d is the damping factor, 
+           walkers is the number of surfers that walk in parallel, at most
+           n // burn_in_steps(d) are used, see surf_visits
+           seed is an optional seed for the random generator
+           links is an optional prebuilt sparse_link_matrix(web, list(web.keys()))
+           
+    Returns a dictionary with the same keys as web (the pages), and
+    the value for key k is the page rank of page k. The sum of all PageRank values 
+    should be 1.
+    """
+    ranking=dict() # the ranking for each page
+    pages = list(web.keys())
+    if links is None:
+        links = sparse_link_matrix(web, pages)
+    indptr, indices, outdegree = links
+
+    rng = np.random.default_rng(seed)
+    visits = surf_visits(indptr, indices, outdegree, n, rng, d, walkers)
+
+    for i, key in enumerate(pages):
+        ranking[key] = visits[i]/n
+
+    return ranking
+
+def parallel_surf_worker(shm_name, N, E, n, seed_sequence, d, walkers):
+    """
+    Runs surf_visits in a worker process on the link structure that
+    random_surf_parallel placed in the shared memory block `shm_name`.
+    Returns the visit counts of the worker.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # the arrays are views of the shared block, nothing is copied
+        links = np.ndarray(2*N + 1 + E, dtype=np.int64, buffer=shm.buf)
+        indptr, indices, outdegree = links[:N+1], links[N+1:N+1+E], links[N+1+E:]
+        visits = surf_visits(indptr, indices, outdegree, n, np.random.default_rng(seed_sequence), d, walkers)
+        del links, indptr, indices, outdegree
+    finally:
+        shm.close()
+    return visits
+
+def random_surf_parallel(web, n, d=0.85, workers=None, walkers=10000, seed=None):
+    """
+    Return PageRank values for each page by sampling `n` pages split over a pool
+    of `workers` processes, each running random_surf_vectorized style surfers.
+    Input: web is a dictionary of webpages and links, 
+           n is an integer, the number of pages sampled in the simulation
+           d is the damping factor, 
+           workers is the number of processes (default: the number of cpus)
+           walkers is the number of surfers that walk in parallel, split over the
+           workers, every worker burns its surfers in as in surf_visits
+           seed is an optional seed, every worker gets its own independent stream
+           spawned from it, so the same seed and number of workers give the same ranking
+
+    The link structure is placed in shared memory once, the workers only get its name.
+    Returns a dictionary with the same keys as web (the pages), and
+    the value for key k is the page rank of page k. The sum of all PageRank values 
+    should be 1.
+    """
+    ranking=dict() # the ranking for each page
+    pages = list(web.keys())
+    N = len(pages)
+    indptr, indices, outdegree = sparse_link_matrix(web, pages)
+    E = len(indices)
+
+    if workers is None:
+        workers = os.cpu_count()
+    seed_sequences = np.random.SeedSequence(seed).spawn(workers)
+    # split the n samples and the surfers as evenly as possible
+    worker_steps = [n//workers + (i < n % workers) for i in range(workers)]
+    worker_walkers = [max(1, walkers//workers + (i < walkers % workers)) for i in range(workers)]
+
+    shm = shared_memory.SharedMemory(create=True, size=(2*N + 1 + E)*8)
+    try:
+        links = np.ndarray(2*N + 1 + E, dtype=np.int64, buffer=shm.buf)
+        links[:N+1] = indptr
+        links[N+1:N+1+E] = indices
+        links[N+1+E:] = outdegree
+        del links
+
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(parallel_surf_worker,
+                [(shm.name, N, E, worker_steps[i], seed_sequences[i], d, worker_walkers[i])
+                 for i in range(workers)])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    visits = sum(results)
+    for i, key in enumerate(pages):
+        ranking[key] = visits[i]/n
+
+    return ranking
+
+def complete_path_pagerank(web, tolerance=0.1, d=0.85, walks_per_batch=1, z=1.96,
+                           min_batches=10, max_batches=10000, seed=None):
+    """
+    Return PageRank values for each page with the Monte Carlo "complete path" method:
+    every batch starts `walks_per_batch` surfers on every page, each surfer stops with
+    probability 1-d after every step, and all pages visited on the way are counted.
+    The batches are independent estimates of the ranking, so instead of comparing with
+    a known ranking we stop once the confidence interval of every page is narrow enough.
+    Input: web is a dictionary of webpages and links, 
+           tolerance is the relative half-width of the confidence interval we accept,
+           measured against the pagerank of the page, at least (1-d)/N
+           d is the damping factor, 
+           walks_per_batch is the number of surfers started on each page per batch
+           z is the normal quantile of the confidence interval (1.96 is 95%)
+           min_batches and max_batches bound the number of batches
+           seed is an optional seed for the random generator
+
+    Returns (ranking, batches) where ranking is a dictionary with the same keys as web
+    and the value for key k is the estimated page rank of page k, and batches is the
+    number of batches used.
+    """
+    ranking=dict() # the ranking for each page
+    pages = list(web.keys())
+    N = len(pages)
+    indptr, indices, outdegree = sparse_link_matrix(web, pages)
+    rng = np.random.default_rng(seed)
+
+    # running mean and sum of squared deviations of the batch estimates (Welford)
+    mean = np.zeros(N)
+    squares = np.zeros(N)
+    starts = np.repeat(np.arange(N), walks_per_batch)
+
+    for batches in range(1, max_batches+1):
+        visits = np.zeros(N, dtype=np.int64)
+        current = starts
+        while len(current) > 0:
+            visits += np.bincount(current, minlength=N)
+            # with probability d a surfer takes another step, from a sink to any page
+            current = current[rng.random(len(current)) < d]
+            current = vectorized_surf_step(indptr, indices, outdegree, current, rng, 1)
+
+        # a walk visits 1/(1-d) pages on average, so this estimate is unbiased
+        estimate = visits*(1-d)/len(starts)
+        delta = estimate - mean
+        mean += delta/batches
+        squares += delta*(estimate - mean)
+
+        if batches >= max(min_batches, 2):
+            halfwidth = z*np.sqrt(squares/(batches-1)/batches)
+            if np.all(halfwidth <= tolerance*np.maximum(mean, (1-d)/N)):
+                break
+
+    mean = mean/mean.sum()
+    for i, key in enumerate(pages):
+        ranking[key] = mean[i]
+
+    return ranking, batches
+
 def plot_ranking(web,ranking,d=0.85):
     """
     plots a graphical representation of the input web, indicating 
@@ -144,54 +472,47 @@ def plot_ranking(web,ranking,d=0.85):
 
 
 ################### Extra functions used for time and convergence data collection ###
-def random_surf_with_thresholds(web,true_ranking, timer, max_iterations, tolerance, d=0.85):
+def random_surf_with_thresholds(web,true_ranking, timer, max_iterations, tolerance, d=0.85, norm="relative"):
     """
     Return PageRank and iteration values for each page by sampling `n` pages
     according to surf_step
     Input: web is a dictionary of webpages and links, 
            n is an integer, the number of steps in the simulation
            d is the damping factor, 
+           norm is how the sample is compared to true_ranking, see ConvergenceCheck
+           in observers.py
            
     Returns a dictionary with thes same keys as web (the pages), and
     the value for key k is the page rank of page k. The sum of all PageRank values 
     should be 1.
     """
     ranking=dict() # the ranking for each page
-    sample = dict()
 
     pages = list(web.keys())
+    ids = {page: i for i, page in enumerate(pages)}
     current_page = random.choice(pages) 
 
-    sample = dict()
+    # the samples of every page, in the order of pages
+    sample = np.zeros(len(pages))
+    frequencies = np.empty(len(pages))
+    check = ConvergenceCheck(true_ranking, pages, tolerance, norm)
 
     def add_sample(page_name):
-        if page_name in sample:
-            sample[page_name] +=1
-        else:
-            sample[page_name] = 1
-
+        sample[ids[page_name]] += 1
 
     def create_ranking(current_iterations):
-        for key in web:
-            if key not in sample:
-                ranking[key] = 0
-            else:
-                ranking[key] = sample[key]/current_iterations
+        for i, key in enumerate(pages):
+            ranking[key] = sample[i]/current_iterations
     def check_sample():
-        create_ranking(current_iterations)
-        for key in true_ranking:
-            if key not in ranking:
-                return False
-            elif not (math.isclose(ranking[key], true_ranking[key], rel_tol = tolerance)):
-                # print(f'not close enough {ranking[key], true_ranking[key]}')
-                return False
-        return True
+        np.divide(sample, current_iterations, out=frequencies)
+        return check(frequencies)
 
     add_sample(current_page)
     current_iterations = 1
 
     while True:
         if (current_iterations == max_iterations-1):
+            create_ranking(current_iterations)
             print(ranking)
             raise Exception('never found stuff')
 
@@ -201,8 +522,8 @@ def random_surf_with_thresholds(web,true_ranking, timer, max_iterations, toleran
         current_page = random.choices(list(new_page_probabilities.keys()), weights=new_page_probabilities.values(), k=1)[0]
         add_sample(current_page)
         timer.stop()
-
         if check_sample():
+            create_ranking(current_iterations)
             return ranking
         current_iterations += 1
 
@@ -3,8 +3,15 @@
  project there
  """
 import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
 
 from pagerank_script1 import make_web, random_surf 
+from observers import ConvergenceObserver, TimerObserver
 import numpy as np
 
 def print_rank(ranking,k=4,title=""):
@@ -29,8 +36,11 @@ def generateinbounddictionary(web):
     inbounddict = {}
     for _page in web:
         inbounddict[_page] = []
-        for outpage in web:
-            if _page in web[outpage]:
+
+    # a single pass over the outlinks, visiting the pages in the same order as web
+    for outpage in web:
+        for _page in web[outpage]:
+            if _page in inbounddict:
                 inbounddict[_page].append(outpage)
     return inbounddict
 
@@ -86,7 +96,348 @@ def rank_update(web,pageranks,_page,inbounddic, d):
     return increments
 
 
-def recursive_pagerank(web,stopvalue,max_iterations=10000,d=0.85):
+class WebIndex:
+    '''
+    Index of the link structure of a web, built in one pass over the outlinks so it
+    can be built once and shared by recursive_pagerank, recursive_pagerank_timed and
+    convergence_recursive_pagerank. The web itself is not changed, so build the index
+    after anything that changes web (like fix_zero_columns) when it is shared.
+
+    pages:     list of the pages, the position of a page in it is its integer id
+    ids:       dictionary from page to its integer id
+    outdegree: numpy vector with the number of outlinks of every page id
+    sources, targets: numpy vectors of all links, link i goes from sources[i] to targets[i]
+    outbound_indptr: the links of page id j are sources[outbound_indptr[j]:outbound_indptr[j+1]]
+               and targets[...], as the links are ordered by source
+    inbound_indptr, inbound_sources: the inbound adjacency in CSR form, the ids of the
+               pages linking to page id j are inbound_sources[inbound_indptr[j]:inbound_indptr[j+1]]
+    inbound:   dictionary as in the output of "generateinbounddictionary"
+    sinks:     list of the pages with no outlinks
+    dangling:  boolean numpy mask of the sinks
+    '''
+    def __init__(self, web):
+        self.pages = list(web.keys())
+        self.ids = {page: j for j, page in enumerate(self.pages)}
+        self.inbound = {page: [] for page in self.pages}
+        self.sinks = []
+
+        N = len(self.pages)
+        self.outdegree = np.zeros(N, dtype=np.int64)
+        sources = []
+        targets = []
+        for j, page in enumerate(self.pages):
+            self.outdegree[j] = len(web[page])
+            if len(web[page]) == 0:
+                self.sinks.append(page)
+            for outpage in web[page]:
+                self.inbound[outpage].append(page)
+                sources.append(j)
+                targets.append(self.ids[outpage])
+
+        self.sources = np.array(sources, dtype=np.int64)
+        self.targets = np.array(targets, dtype=np.int64)
+        self.dangling = self.outdegree == 0
+
+        # sort the links by target to get the inbound links of each page next to each other
+        order = np.argsort(self.targets, kind='stable')
+        self.inbound_sources = self.sources[order]
+        self.inbound_indptr = np.zeros(N+1, dtype=np.int64)
+        np.cumsum(np.bincount(self.targets, minlength=N), out=self.inbound_indptr[1:])
+        self.outbound_indptr = np.zeros(N+1, dtype=np.int64)
+        np.cumsum(self.outdegree, out=self.outbound_indptr[1:])
+
+    def apply_changes(self, web, added_links=(), removed_links=(), added_pages=(), removed_pages=()):
+        '''
+        Applies the changes to web as "apply_web_changes" does, and patches the index to
+        be the index of the changed web. Only the changed pages are looked at: the links
+        to removed pages are found with the inbound links, the link arrays are patched
+        with np.delete and np.insert and only the dictionaries of the changed pages are
+        updated. Removing pages renumbers the page ids, so then pages and ids are rebuilt.
+        The changes are checked with "check_web_changes" before anything is changed.
+        '''
+        check_web_changes(web, added_links, removed_links, added_pages, removed_pages)
+        for page in added_pages:
+            if page not in web:
+                web[page] = set()
+                self.ids[page] = len(self.pages)
+                self.pages.append(page)
+                self.inbound[page] = []
+        grow = len(self.pages) - len(self.outdegree)
+        if grow > 0:
+            self.outdegree = np.concatenate([self.outdegree, np.zeros(grow, dtype=np.int64)])
+            self.inbound_indptr = np.concatenate([self.inbound_indptr, np.full(grow, self.inbound_indptr[-1])])
+
+        # compare the outlinks before and after the changes of every page that can change
+        removed_pages = set(removed_pages)
+        touched = {page for page, _ in added_links} | {page for page, _ in removed_links} | removed_pages
+        for page in removed_pages:
+            touched.update(self.inbound[page])
+        before = {page: set(web[page]) for page in touched}
+
+        for page, outpage in added_links:
+            web[page].add(outpage)
+        for page, outpage in removed_links:
+            web[page].discard(outpage)
+        for page in touched:
+            if page in removed_pages:
+                web[page] = set()
+            else:
+                web[page] -= removed_pages
+
+        added = [(self.ids[page], self.ids[outpage]) for page in touched for outpage in web[page] - before[page]]
+        removed = [(self.ids[page], self.ids[outpage]) for page in touched for outpage in before[page] - web[page]]
+        for page in removed_pages:
+            del web[page]
+
+        indegree = np.diff(self.inbound_indptr)
+        outbound_indptr = np.zeros(len(self.pages)+1, dtype=np.int64)
+        np.cumsum(self.outdegree, out=outbound_indptr[1:])
+        if removed:
+            outbound, inbound = [], []
+            for p, q in removed:
+                first, last = outbound_indptr[p], outbound_indptr[p+1]
+                outbound.append(first + np.flatnonzero(self.targets[first:last] == q)[0])
+                first, last = self.inbound_indptr[q], self.inbound_indptr[q+1]
+                inbound.append(first + np.flatnonzero(self.inbound_sources[first:last] == p)[0])
+                self.inbound[self.pages[q]].remove(self.pages[p])
+            self.sources = np.delete(self.sources, outbound)
+            self.targets = np.delete(self.targets, outbound)
+            self.inbound_sources = np.delete(self.inbound_sources, inbound)
+            p, q = np.array(removed).T
+            np.subtract.at(self.outdegree, p, 1)
+            np.subtract.at(indegree, q, 1)
+            np.cumsum(self.outdegree, out=outbound_indptr[1:])
+            np.cumsum(indegree, out=self.inbound_indptr[1:])
+
+        if added:
+            p, q = np.array(added).T
+            # every new link goes at the end of the links of its source and of its target
+            self.sources = np.insert(self.sources, outbound_indptr[p+1], p)
+            self.targets = np.insert(self.targets, outbound_indptr[p+1], q)
+            self.inbound_sources = np.insert(self.inbound_sources, self.inbound_indptr[q+1], p)
+            for source, target in added:
+                self.inbound[self.pages[target]].append(self.pages[source])
+            np.add.at(self.outdegree, p, 1)
+            np.add.at(indegree, q, 1)
+            np.cumsum(self.outdegree, out=outbound_indptr[1:])
+            np.cumsum(indegree, out=self.inbound_indptr[1:])
+
+        if removed_pages:
+            # the removed pages have no links left, the others move down to fill their ids
+            keep = np.ones(len(self.pages), dtype=bool)
+            keep[[self.ids[page] for page in removed_pages]] = False
+            renumber = np.cumsum(keep) - 1
+            self.sources = renumber[self.sources]
+            self.targets = renumber[self.targets]
+            self.inbound_sources = renumber[self.inbound_sources]
+            self.outdegree = self.outdegree[keep]
+            self.inbound_indptr = np.zeros(np.count_nonzero(keep)+1, dtype=np.int64)
+            np.cumsum(indegree[keep], out=self.inbound_indptr[1:])
+            outbound_indptr = np.zeros(np.count_nonzero(keep)+1, dtype=np.int64)
+            np.cumsum(self.outdegree, out=outbound_indptr[1:])
+
+            self.pages = [page for page in self.pages if page not in removed_pages]
+            self.ids = {page: j for j, page in enumerate(self.pages)}
+            for page in removed_pages:
+                del self.inbound[page]
+
+        self.outbound_indptr = outbound_indptr
+        self.dangling = self.outdegree == 0
+        self.sinks = [self.pages[j] for j in np.flatnonzero(self.dangling)]
+
+def vectorized_rank_update(pageranks,sources,targets,outdegree,dangling,d):
+    '''
+    Jacobi update of all pageranks at once with the formula of rank_update
+        PR(p)= (1-d)/N + d*sum_j (PR(q)/OB(q))
+    Input: pageranks is a numpy vector of the current pageranks, sources, targets,
+           outdegree and dangling are as in the attributes of "WebIndex",
+           and d is the damping factor.
+    Output: (newpageranks, increments), the updated numpy vector and the (absolute)
+            difference between the previous and the updated value of every page.
+    '''
+    N = len(pageranks)
+
+    # sum PR(q)/OB(q) over the inbound links of every page
+    inboundsum = np.bincount(targets, weights=pageranks[sources]/outdegree[sources], minlength=N)
+    # sinks are treated as linking to all pages in web
+    inboundsum += pageranks[dangling].sum()/N
+
+    newpageranks = (1-d)/N + d*inboundsum
+    return newpageranks, np.abs(pageranks - newpageranks)
+
+
+def gauss_seidel_rank_update(pageranks,inbound,outdegree,dangling,d,omega=1.0):
+    '''
+    Gauss-Seidel update of all pageranks with the formula of rank_update
+        PR(p)= (1-d)/N + d*sum_j (PR(q)/OB(q))
+    where the pageranks are changed in place, so pages later in the sweep already use
+    the new pageranks of the pages before them. With omega different from 1 it is
+    successive over-relaxation: PR(p) moves omega times the Gauss-Seidel change.
+    After the sweep the pageranks are scaled to sum to 1.
+    Input: pageranks is a list of the current pageranks by page id, inbound is a list
+           with the list of inbound page ids of every page id, outdegree and dangling
+           are lists as the attributes of "WebIndex", d is the damping factor
+    Output: list of the increments, the (absolute) difference between the previous
+            and the updated value of every page.
+    '''
+    N = len(pageranks)
+    previous = list(pageranks)
+    # sinks are treated as linking to all pages in web
+    sinkmass = sum(pageranks[q] for q in range(N) if dangling[q])
+
+    for page in range(N):
+        inboundsum = sinkmass/N
+        for q in inbound[page]:
+            inboundsum += pageranks[q]/outdegree[q]
+
+        pagerank = (1-d)/N + d*inboundsum
+        change = omega*(pagerank - pageranks[page])
+        pageranks[page] += change
+        if dangling[page]:
+            sinkmass += change
+
+    increments = [abs(pageranks[page] - previous[page]) for page in range(N)]
+
+    # unlike the Jacobi update the sweep does not keep the sum at 1, and the error in
+    # the sum only shrinks by a factor d per sweep, so we normalize it away
+    total = sum(pageranks)
+    for page in range(N):
+        pageranks[page] /= total
+    return increments
+
+
+def adaptive_rank_update(pageranks,inboundsum,active,index,d):
+    '''
+    Jacobi update with the formula of rank_update of only the active pages, the others
+    keep their pagerank but still pass it on along their outlinks.
+    The sums of the formula are kept up to date instead of summed again: the changes of
+    the active pages are pushed along their outlinks only, so the update costs the
+    outlinks of the active pages instead of all links.
+    Input: pageranks is a numpy vector of the current pageranks by page id, inboundsum
+           is a numpy vector with sum_j (PR(q)/OB(q)) of every page id (with sinks linking
+           to all pages) for pageranks, active is a numpy vector of the page ids to update,
+           index is the "WebIndex" of the web and d is the damping factor.
+    Output: The numpy vectors "pageranks" of the active pages and "inboundsum" of all
+            pages are updated, and this function returns the numpy vector of the
+            (absolute) increments of the active pages.
+    '''
+    N = len(pageranks)
+    changes = (1-d)/N + d*inboundsum[active] - pageranks[active]
+    pageranks[active] += changes
+
+    linking = ~index.dangling[active]
+    if 2*len(active) > N:
+        # with many active pages it is cheaper to push over all links at once
+        shares = np.zeros(N)
+        shares[active] = changes
+        np.divide(shares, index.outdegree, out=shares, where=~index.dangling)
+        inboundsum += np.bincount(index.targets, weights=shares[index.sources], minlength=N)
+    else:
+        sources = active[linking]
+        counts = index.outdegree[sources]
+        firsts = np.repeat(index.outbound_indptr[sources] - np.cumsum(counts) + counts, counts)
+        targets = index.targets[firsts + np.arange(counts.sum())]
+        inboundsum += np.bincount(targets, weights=np.repeat(changes[linking]/counts, counts), minlength=N)
+    # sinks are treated as linking to all pages in web
+    inboundsum += changes[~linking].sum()/N
+    return np.abs(changes)
+
+
+def balanced_chunks(indptr,chunks):
+    '''
+    Splits the rows of a CSR adjacency into ranges of rows with about the same work,
+    counting one for every entry and one for every row.
+    Input: indptr is as the inbound_indptr of "WebIndex", chunks is the number of ranges
+    Output: numpy vector of at most chunks+1 increasing row boundaries from 0 to N,
+            range c is the rows bounds[c]:bounds[c+1], no range is empty
+    '''
+    work = indptr + np.arange(len(indptr))
+    bounds = np.searchsorted(work, np.linspace(0, work[-1], chunks+1))
+    return np.unique(bounds)
+
+
+class ParallelRankUpdate:
+    '''
+    The Jacobi update of "vectorized_rank_update" split over a pool of threads.
+    The pages are split by "balanced_chunks" of the inbound adjacency of index, and
+    every thread sums the inbound links of its pages with numpy kernels that release
+    the GIL, into vectors allocated once. The sink mass and the residual are reduced
+    over the chunks in a fixed order, so the result does not depend on the scheduling
+    of the threads, and runs with the same number of threads give the same pageranks.
+    Input: index is the "WebIndex" of the web, d is the damping factor and threads the
+           number of threads, default the number of cpus
+    '''
+    def __init__(self, index, d, threads=None):
+        if threads is None:
+            threads = os.cpu_count()
+        self.d = d
+        self.N = len(index.pages)
+        self.outdegree = index.outdegree
+        self.executor = ThreadPoolExecutor(threads)
+
+        self.bounds = balanced_chunks(index.inbound_indptr, threads)
+        self.chunks = []
+        for lo, hi in zip(self.bounds[:-1], self.bounds[1:]):
+            first, last = index.inbound_indptr[lo], index.inbound_indptr[hi]
+            counts = np.diff(index.inbound_indptr[lo:hi+1])
+            linked = np.flatnonzero(counts) # the pages of the chunk with inbound links
+            self.chunks.append({
+                'pages': slice(lo, hi),
+                'sources': index.inbound_sources[first:last],
+                'shares': np.empty(last - first),
+                'linked': linked,
+                'starts': index.inbound_indptr[lo:hi][linked] - first,
+                'sums': np.empty(len(linked)),
+                'sinks': lo + np.flatnonzero(index.dangling[lo:hi]),
+            })
+
+        self.share = np.zeros(self.N) # PR(q)/OB(q) of every page, 0 for sinks
+        self.increments = np.empty(self.N)
+        self.new = np.empty(self.N)
+
+    def _share(self, chunk, pageranks):
+        pages = chunk['pages']
+        np.divide(pageranks[pages], self.outdegree[pages], out=self.share[pages],
+                  where=self.outdegree[pages] > 0)
+        return pageranks.take(chunk['sinks']).sum()
+
+    def _sum(self, chunk, pageranks, base):
+        pages = chunk['pages']
+        new = self.new[pages]
+        new.fill(base)
+        if len(chunk['linked']) > 0:
+            np.take(self.share, chunk['sources'], out=chunk['shares'])
+            np.add.reduceat(chunk['shares'], chunk['starts'], out=chunk['sums'])
+            chunk['sums'] *= self.d
+            chunk['sums'] += base
+            new[chunk['linked']] = chunk['sums']
+
+        increments = self.increments[pages]
+        np.subtract(new, pageranks[pages], out=increments)
+        np.abs(increments, out=increments)
+        return increments.max()
+
+    def update(self, pageranks):
+        '''
+        Output: (newpageranks, residual), the updated numpy vector and the largest
+                increment of a pagerank. The vectors are reused: pageranks holds the
+                result of the next update, and self.increments the increments.
+        '''
+        sinkmass = sum(self.executor.map(lambda chunk: self._share(chunk, pageranks), self.chunks))
+        # sinks are treated as linking to all pages in web
+        base = (1-self.d)/self.N + self.d*sinkmass/self.N
+        residual = max(self.executor.map(lambda chunk: self._sum(chunk, pageranks, base), self.chunks))
+
+        newpageranks = self.new
+        self.new = pageranks
+        return newpageranks, residual
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def recursive_pagerank(web,stopvalue,max_iterations=10000,d=0.85,method="dict",index=None,omega=1.0,
+                       freeze_after=2,observer=None,threads=None):
     """
     Implements the recursive version of the PageRank algorithm by first creating a
     pagerank of 1/N to all pages (where N is the total number of pages)
@@ -96,48 +447,300 @@ def recursive_pagerank(web,stopvalue,max_iterations=10000,d=0.85):
     is less than stopvalue, 
     Stopping condition 2: the number of iterations has reached "max_iterations"
     Input: web is a dictionary as in the output of "make_web", d is the damping constant,
-    stop value is a positive float, max_iterations is a positive integer
+    stop value is a positive float, max_iterations is a positive integer,
+    method is "dict" to update page by page with "rank_update" or "vectorized" to
+    update all pages at once on numpy arrays with "vectorized_rank_update" (both are
+    Jacobi updates), or "gauss-seidel" or "sor" to update the pages in place with
+    "gauss_seidel_rank_update", where "sor" uses the relaxation factor omega, or
+    "adaptive" to update with "adaptive_rank_update" where pages whose increment has been
+    less than their threshold, stopvalue scaled by their pagerank relative to the largest,
+    for freeze_after iterations in a row are frozen and not updated until the change
+    flowing into them reaches the threshold (the increments of all pages are known, so
+    the stopping condition is the same, it updates fewer pages than "vectorized" but
+    pushing the changes along the links of single pages costs more per link, so it only
+    pays off when most pages settle early),
+    or "parallel" for the Jacobi update of "ParallelRankUpdate" on threads threads,
+    index is an optional prebuilt "WebIndex" of web to share between runs,
+    observer is an optional Observer (see observers.py) that gets the "build" phase and
+    every iteration, and can stop the iterations
     """
-    #initialize pageranks to 1/N
-    pageranks=dict()
-    for key in web:
-        pageranks[key] = 1/len(web)
+    if observer is not None:
+        start = time.perf_counter()
+    if index is None:
+        index = WebIndex(web)
+    N = len(index.pages)
+
+    # every method has an update, doing one iteration and returning the maximum
+    # increment and whether to stop, and a function giving the pageranks as a vector
+    if method == "vectorized":
+        ranks = np.full(N, 1/N)
+
+        def update():
+            nonlocal ranks
+            ranks, increments = vectorized_rank_update(ranks, index.sources, index.targets,
+                                                       index.outdegree, index.dangling, d)
+            return increments.max(), np.all(increments < stopvalue)
+        current = lambda: ranks
+    elif method == "parallel":
+        ranks = np.full(N, 1/N)
+        parallel = ParallelRankUpdate(index, d, threads)
+
+        def update():
+            nonlocal ranks
+            ranks, residual = parallel.update(ranks)
+            return residual, residual < stopvalue
+        current = lambda: ranks
+    elif method in ("gauss-seidel", "sor"):
+        if method == "gauss-seidel":
+            omega = 1.0
+        ranks = [1/N]*N
+        inbound = [index.inbound_sources[index.inbound_indptr[j]:index.inbound_indptr[j+1]].tolist()
+                   for j in range(N)]
+        outdegree = index.outdegree.tolist()
+        dangling = index.dangling.tolist()
+
+        def update():
+            increments = gauss_seidel_rank_update(ranks, inbound, outdegree, dangling, d, omega)
+            return max(increments), all(x < stopvalue for x in increments)
+        current = lambda: np.array(ranks)
+    elif method == "adaptive":
+        ranks = np.full(N, 1/N)
+        # sinks are treated as linking to all pages in web
+        shares = np.divide(ranks, index.outdegree, out=np.zeros(N), where=~index.dangling)
+        inboundsum = (np.bincount(index.targets, weights=shares[index.sources], minlength=N)
+                      + ranks[index.dangling].sum()/N)
+        active = np.arange(N)
+        calm = np.zeros(N, dtype=np.int64) # iterations in a row with small increments
+        target = np.empty(N)
+        residual = np.empty(N)
+        threshold = np.empty(N)
+
+        def update():
+            nonlocal active
+            increments = adaptive_rank_update(ranks, inboundsum, active, index, d)
+            largest = increments.max() if len(increments) > 0 else 0.0
+
+            # the increment every page would get if it was updated now, with inboundsum
+            # kept up to date this is known for the frozen pages as well
+            np.multiply(inboundsum, d, out=target)
+            np.add(target, (1-d)/N, out=target)
+            np.subtract(target, ranks, out=residual)
+            np.abs(residual, out=residual)
+            if residual.max() < stopvalue:
+                # the stopping condition holds for the sweep over all pages, so take it
+                ranks[:] = target
+                return largest, True
 
-    inbounddic = generateinbounddictionary(web)
+            # pages converge to stopvalue relative to the largest pagerank, the pages with
+            # small pageranks pass on little, so they have to settle as far as the large
+            # ones for the pages they link to to be within stopvalue of the Jacobi result
+            np.multiply(ranks, stopvalue/ranks.max(), out=threshold)
+            calm[active] = np.where(increments < threshold[active], calm[active] + 1, 0)
+            # a frozen page wakes up once the change flowing into it since its last
+            # update would change it by its threshold
+            woken = residual >= threshold
+            calm[woken] = 0
+            woken |= calm < freeze_after
+            active = np.flatnonzero(woken)
+            return largest, False
+        current = lambda: ranks
+    elif method == "dict":
+        #initialize pageranks to 1/N
+        pageranks=dict()
+        for key in web:
+            pageranks[key] = 1/len(web)
+
+        inbounddic = index.inbound
+
+        def update():
+            increments = rank_update(web, pageranks, "page", inbounddic, d)
+            # if all the increments are smaller than our stopvalue we break and return
+            return max(increments), all(x < stopvalue for x in increments)
+        current = lambda: np.fromiter(pageranks.values(), dtype=float, count=N)
+    else:
+        raise Exception(f'unknown method {method}')
+
+    if observer is not None:
+        observer.phase("build", time.perf_counter() - start)
+        elapsed = 0.0
 
     for iteration in range(max_iterations):
-        increments = rank_update(web, pageranks, "page", inbounddic, d)
-        # if all the increments are smaller than our stopvalue we break and return
-        if all(x < stopvalue for x in increments):
+        if observer is None:
+            if update()[1]:
+                break
+            continue
+
+        start = time.perf_counter()
+        residual, converged = update()
+        elapsed += time.perf_counter() - start
+        if observer.iteration(iteration, residual, elapsed, current()) or converged:
             break
+
+    if method == "parallel":
+        parallel.close()
+    if method == "dict":
+        return pageranks, iteration
+
+    ranks = current()
+    pageranks = dict()
+    for i, page in enumerate(index.pages):
+        pageranks[page] = ranks[i]
     return pageranks, iteration
 
 
-def recursive_pagerank_timed(web,true_ranking,tolerance,max_iterations,timer,d=0.85):
-    ''' Timed version of recursive pagerank'''
+def distributed_worker(shm_name,size,layout,block,d,stopvalue,max_iterations,barrier):
+    '''
+    Runs the Jacobi update of the pages of one block for "distributed_pagerank" in a
+    worker process. Every iteration the worker writes the PR(q)/OB(q) of its pages that
+    other blocks link from (its boundary) and its sink mass to the shared memory block
+    shm_name, waits for the other workers, reads the boundary values of the pages linking
+    to its own pages, updates them and shares its largest increment, so that all workers
+    stop together. At the end it writes its pageranks to the shared memory block.
+    '''
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        shared = np.ndarray(size, dtype=np.float64, buffer=shm.buf)
+        outbox = shared[layout['outbox']]
+        sinkmasses = shared[layout['sinkmass']]
+        residuals = shared[layout['residual']]
 
-    def check_ranking():
-        for key in true_ranking:
-            if key not in pageranks:
-                return False
-            elif not (math.isclose(pageranks[key], true_ranking[key], rel_tol = tolerance)):
-                return False
-        return True
+        N, w = layout['N'], block['worker']
+        outdegree = block['outdegree']
+        pages = len(outdegree)
+        ranks = np.full(pages, 1/N)
+        share = np.zeros(pages)
+        values = np.empty(len(block['own']) + len(block['remote']))
 
-    #initialize pageranks to 1/N
-    pageranks=dict()
-    for key in web:
-        pageranks[key] = 1/len(web)
+        for iteration in range(max_iterations):
+            np.divide(ranks, outdegree, out=share, where=outdegree > 0)
+            outbox[block['outbox']] = share[block['boundary']]
+            sinkmasses[w] = ranks[block['sinks']].sum()
+            barrier.wait()
 
-    inbounddic = generateinbounddictionary(web)
+            # the values of all pages linking to the block, from this and the other blocks
+            values[block['own']] = share[block['own_sources']]
+            values[block['remote']] = outbox[block['remote_sources']]
+            # sinks are treated as linking to all pages in web
+            inboundsum = (np.bincount(block['targets'], weights=values[block['links']], minlength=pages)
+                          + sinkmasses.sum()/N)
 
-    for iteration in range(max_iterations):
-        increments = rank_update(web, pageranks, "page",inbounddic, d)
-        timer.stop()
-        if check_ranking():
-            break
-        timer.start()
-    else:
+            newranks = (1-d)/N + d*inboundsum
+            residuals[w] = np.abs(newranks - ranks).max(initial=0)
+            ranks = newranks
+            barrier.wait()
+            # every worker reduces the same residuals, so they all stop at the same iteration
+            if residuals.max() < stopvalue:
+                break
+
+        shared[layout['ranks']][block['pages']] = ranks
+        if w == 0:
+            shared[layout['iteration']] = iteration
+        del shared, outbox, sinkmasses, residuals
+    finally:
+        shm.close()
+
+def distributed_pagerank(web,stopvalue,max_iterations=10000,d=0.85,workers=None,index=None):
+    '''
+    The "vectorized" method of recursive_pagerank with the pages split into blocks,
+    each updated by its own worker process, which only gets the inbound links of its
+    block. The workers exchange only the values of the pages on the boundary between
+    the blocks through shared memory, and reduce the sink mass and the largest increment
+    over all blocks in the same fixed order, so they agree on when to stop.
+    Input: as recursive_pagerank, workers is the number of processes (default the
+           number of cpus) and index an optional prebuilt "WebIndex" of web
+    Output: (pageranks, iteration) as in recursive_pagerank
+    '''
+    if index is None:
+        index = WebIndex(web)
+    if workers is None:
+        workers = os.cpu_count()
+    N = len(index.pages)
+    indptr = index.inbound_indptr
+
+    bounds = balanced_chunks(indptr, workers)
+    P = len(bounds) - 1
+    owner = np.repeat(np.arange(P), np.diff(bounds)) # block of every page id
+
+    # the pages linking to each block, and the pages every block has to share
+    needed = [np.unique(index.inbound_sources[indptr[lo]:indptr[hi]]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+    remote = np.concatenate([ids[owner[ids] != w] for w, ids in enumerate(needed)] + [np.empty(0, dtype=np.int64)])
+    remote = np.unique(remote)
+    boundary = [remote[owner[remote] == w] for w in range(P)]
+    offsets = np.concatenate(([0], np.cumsum([len(ids) for ids in boundary])))
+
+    blocks = []
+    for w, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        sources = index.inbound_sources[indptr[lo]:indptr[hi]]
+        own = owner[needed[w]] == w
+        remote_ids = needed[w][~own]
+        remote_sources = np.empty(len(remote_ids), dtype=np.int64)
+        for p in range(P):
+            from_p = owner[remote_ids] == p
+            remote_sources[from_p] = offsets[p] + np.searchsorted(boundary[p], remote_ids[from_p])
+        blocks.append({
+            'worker': w,
+            'pages': slice(lo, hi),
+            'outdegree': index.outdegree[lo:hi],
+            'sinks': np.flatnonzero(index.dangling[lo:hi]),
+            'boundary': boundary[w] - lo,
+            'outbox': slice(offsets[w], offsets[w+1]),
+            'own': np.flatnonzero(own),
+            'own_sources': needed[w][own] - lo,
+            'remote': np.flatnonzero(~own),
+            'remote_sources': remote_sources,
+            'links': np.searchsorted(needed[w], sources),
+            'targets': np.repeat(np.arange(hi - lo), np.diff(indptr[lo:hi+1])),
+        })
+
+    B = offsets[-1]
+    layout = {'N': N,
+              'outbox': slice(0, B),
+              'sinkmass': slice(B, B + P),
+              'residual': slice(B + P, B + 2*P),
+              'ranks': slice(B + 2*P, B + 2*P + N),
+              'iteration': B + 2*P + N}
+    size = B + 2*P + N + 1
+
+    shm = shared_memory.SharedMemory(create=True, size=size*8)
+    try:
+        barrier = multiprocessing.Barrier(P)
+        processes = [multiprocessing.Process(target=distributed_worker,
+                        args=(shm.name, size, layout, block, d, stopvalue, max_iterations, barrier))
+                     for block in blocks]
+        for process in processes:
+            process.start()
+        # if a worker dies the others would wait at the barrier forever
+        while any(process.is_alive() for process in processes):
+            for process in processes:
+                process.join(timeout=0.1)
+                if process.exitcode not in (None, 0):
+                    barrier.abort()
+        if any(process.exitcode != 0 for process in processes):
+            raise Exception('a worker of distributed_pagerank failed')
+
+        shared = np.ndarray(size, dtype=np.float64, buffer=shm.buf)
+        ranks = shared[layout['ranks']].copy()
+        iteration = int(shared[layout['iteration']])
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    pageranks = dict()
+    for i, page in enumerate(index.pages):
+        pageranks[page] = ranks[i]
+    return pageranks, iteration
+
+
+def recursive_pagerank_timed(web,true_ranking,tolerance,max_iterations,timer,d=0.85,index=None,
+                             norm="relative"):
+    ''' Timed version of recursive pagerank: runs until the pageranks are within tolerance of
+    true_ranking in norm (see ConvergenceCheck in observers.py), with timer paused while
+    that is checked. index is an optional prebuilt "WebIndex" of web'''
+    convergence = ConvergenceObserver(true_ranking, list(web.keys()), tolerance, norm=norm)
+    pageranks, iteration = recursive_pagerank(web, 0, max_iterations, d, index=index,
+                                              observer=TimerObserver(timer, convergence))
+    if not convergence.converged:
         raise Exception('did not find anything')
 
     return pageranks, iteration
@@ -145,43 +748,401 @@ def recursive_pagerank_timed(web,true_ranking,tolerance,max_iterations,timer,d=0
 
 def get_vector(pageranking):
     ''' creates a vector from the ranking '''
-    mat = np.empty((0, 1))  
-    for key in pageranking:
-        mat = np.vstack([mat, [[pageranking[key]]]]) 
-    return mat    
-
-def convergence_recursive_pagerank(web,true_ranking,tolerance,max_iterations,writer, d=0.85):
-    true_vec = get_vector(true_ranking)
-
-    pageranks=dict()
-    def check_ranking():
-        curr_rank = get_vector(pageranks)
-
-        max_matrix_norm = np.max(np.abs(true_vec - curr_rank))
-        writer.writerow([max_matrix_norm])
-        # add the data first
-        
-        for key in true_ranking:
-            if key not in pageranks:
-                return False
-            elif not (math.isclose(pageranks[key], true_ranking[key], rel_tol = tolerance)):
-                # print(f'not close enough {ranking[key], true_ranking[key]}')
-                return False
-        return True
-
-    #initialize pageranks to 1/N
-    for key in web:
-        pageranks[key] = 1/len(web)
-
-    inbounddic = generateinbounddictionary(web)
+    return np.fromiter(pageranking.values(), dtype=float, count=len(pageranking)).reshape(-1, 1)
+
+def convergence_recursive_pagerank(web,true_ranking,tolerance,max_iterations,writer, d=0.85, index=None,
+                                   norm="relative"):
+    ''' Recursive pagerank writing the max norm error of every iteration with writer,
+    until the pageranks are within tolerance of true_ranking in norm (see ConvergenceCheck
+    in observers.py). index is an optional prebuilt "WebIndex" of web '''
+    convergence = ConvergenceObserver(true_ranking, list(web.keys()), tolerance, writer, norm)
+    pageranks, iteration = recursive_pagerank(web, 0, max_iterations, d, index=index, observer=convergence)
+    if not convergence.converged:
+        raise Exception('did not find anything')
+
+    return pageranks, iteration
+
 
+def write_edge_list(web,filename,index=None):
+    '''
+    writes the links of web to filename as a binary edge list, the format read by
+    "streaming_pagerank": int64 (source, target) pairs of page ids, sorted by target.
+    index is an optional prebuilt "WebIndex" of web.
+    Output: the list of pages, where page id j is pages[j]
+    '''
+    if index is None:
+        index = WebIndex(web)
+    targets = np.repeat(np.arange(len(index.pages)), np.diff(index.inbound_indptr))
+    np.stack([index.inbound_sources, targets], axis=1).tofile(filename)
+    return index.pages
+
+def streaming_pagerank(filename,pages,stopvalue,max_iterations=10000,d=0.85,chunk_size=2**22):
+    """
+    Out of core version of recursive_pagerank(method="vectorized") for webs too large
+    for memory. The links are read from the binary edge list in filename (as written
+    by "write_edge_list") through np.memmap, chunk_size links at a time, on every
+    iteration, so only the O(N) rank vectors are kept in memory.
+    Input: filename is the edge list, pages is the list of pages where page id j
+    is pages[j], d is the damping constant, stop value is a positive float,
+    max_iterations is a positive integer, chunk_size is the number of links per chunk
+    Output: (pageranks, iteration) as in recursive_pagerank
+    """
+    if os.path.getsize(filename) == 0:
+        # a web without links can not be memory mapped
+        edges = np.empty((0, 2), dtype=np.int64)
+    else:
+        edges = np.memmap(filename, dtype=np.int64, mode='r').reshape(-1, 2)
+    N = len(pages)
+
+    # first pass over the links to count the outlinks of every page
+    outdegree = np.zeros(N, dtype=np.int64)
+    for start in range(0, len(edges), chunk_size):
+        outdegree += np.bincount(edges[start:start+chunk_size, 0], minlength=N)
+    dangling = outdegree == 0
+
+    ranks = np.full(N, 1/N)
     for iteration in range(max_iterations):
-        increments = rank_update(web, pageranks, "page",inbounddic, d)
-        if check_ranking():
+        share = np.divide(ranks, outdegree, out=np.zeros(N), where=~dangling)
+
+        inboundsum = np.zeros(N)
+        for start in range(0, len(edges), chunk_size):
+            chunk = np.asarray(edges[start:start+chunk_size])
+            # the links are sorted by target, so a chunk only touches a range of pages
+            first = chunk[:, 1].min()
+            sums = np.bincount(chunk[:, 1] - first, weights=share[chunk[:, 0]])
+            inboundsum[first:first+len(sums)] += sums
+        # sinks are treated as linking to all pages in web
+        inboundsum += ranks[dangling].sum()/N
+
+        newranks = (1-d)/N + d*inboundsum
+        increments = np.abs(ranks - newranks)
+        ranks = newranks
+        if np.all(increments < stopvalue):
             break
+
+    pageranks = dict()
+    for i, page in enumerate(pages):
+        pageranks[page] = ranks[i]
+    return pageranks, iteration
+
+
+def check_web_changes(web,added_links=(),removed_links=(),added_pages=(),removed_pages=()):
+    '''
+    Raises an exception if the changes of "apply_web_changes" name a page that is neither
+    in web nor added, so a bad change is found before web (or an index of it) is changed.
+    '''
+    added_pages = set(added_pages)
+    for page, outpage in added_links:
+        for linked in (page, outpage):
+            if linked not in web and linked not in added_pages:
+                raise Exception(f'link {page} -> {outpage} to unknown page {linked}')
+    for page, outpage in removed_links:
+        if page not in web and page not in added_pages:
+            raise Exception(f'link {page} -> {outpage} from unknown page {page}')
+    for page in removed_pages:
+        if page not in web and page not in added_pages:
+            raise Exception(f'removing unknown page {page}')
+
+def apply_web_changes(web,added_links=(),removed_links=(),added_pages=(),removed_pages=()):
+    '''
+    Changes web in place: first the added pages (without links) are added, then the added
+    and removed links, given as (page, linked page) pairs, and finally the removed pages
+    are deleted together with all links to them.
+    The changes are checked with "check_web_changes" before anything is changed.
+    '''
+    check_web_changes(web, added_links, removed_links, added_pages, removed_pages)
+    for page in added_pages:
+        web.setdefault(page, set())
+    for page, outpage in added_links:
+        web[page].add(outpage)
+    for page, outpage in removed_links:
+        web[page].discard(outpage)
+
+    removed_pages = set(removed_pages)
+    if removed_pages:
+        for page in removed_pages:
+            del web[page]
+        for page in web:
+            web[page] -= removed_pages
+
+def incremental_pagerank(web,pageranks,stopvalue,added_links=(),removed_links=(),added_pages=(),
+                         removed_pages=(),max_iterations=10000,d=0.85,index=None):
+    """
+    Updates a ranking computed by recursive_pagerank after the web has changed, instead
+    of starting again from 1/N for all pages.
+    The changes are applied to web, then the old pageranks (and (1-d)/N for new pages)
+    are used as the start. A single vectorized sweep gives the residual of every page,
+    the change one more "vectorized_rank_update" would make to it, and after that only
+    pages whose residual is at least stopvalue*(1-d) are updated: their residual is added
+    to their pagerank and pushed along their outlinks. The tighter threshold keeps the
+    residuals left behind from adding up, and the pushes end with Jacobi sweeps until the
+    stopping condition of recursive_pagerank holds: the maximum change over all pageranks
+    is less than stopvalue.
+    The pushes only touch the linked pages: the pushes of sinks, which go to all pages,
+    are kept as one residual shared by all pages, and all pages are only checked again
+    once that shared residual has moved more than the smallest gap to stopvalue.
+    Input: web is a dictionary as in the output of "make_web" before the changes,
+    pageranks is its ranking, stopvalue and max_iterations are as in recursive_pagerank,
+    the changes are as in "apply_web_changes", d is the damping constant, index is the
+    "WebIndex" of web before the changes, it is patched in place with
+    "WebIndex.apply_changes" (so it is the index of the changed web for the next call)
+    instead of being built again
+    Output: (pageranks, iteration) as in recursive_pagerank, where iteration counts
+    the rounds of pushes
+    """
+    if index is None:
+        apply_web_changes(web, added_links, removed_links, added_pages, removed_pages)
+        index = WebIndex(web)
+    else:
+        index.apply_changes(web, added_links, removed_links, added_pages, removed_pages)
+    N = len(index.pages)
+
+    ranks = np.full(N, (1-d)/N)
+    if list(pageranks) == index.pages[:len(pageranks)]:
+        # the usual case, the ranking of the web before the changes without removed pages
+        ranks[:len(pageranks)] = np.fromiter(pageranks.values(), dtype=float, count=len(pageranks))
     else:
+        for i, page in enumerate(index.pages):
+            if page in pageranks:
+                ranks[i] = pageranks[page]
+    # the pageranks of the fixed point sum to 1, the removed pages took theirs with them
+    ranks /= ranks.sum()
+
+    # pushing only the residuals of at least stopvalue leaves residuals just below it,
+    # of the same sign, on every page pushed to, which add up to errors many times
+    # stopvalue, so push down to a tighter threshold
+    threshold = stopvalue*(1-d)
+
+    newranks, _ = vectorized_rank_update(ranks, index.sources, index.targets,
+                                         index.outdegree, index.dangling, d)
+    # the residual of page i is residual[i] + uniform
+    residual = newranks - ranks
+    uniform = 0.0
+
+    def check_all():
+        # the active pages and the smallest gap of the others to stopvalue
+        magnitude = np.abs(residual + uniform)
+        active = np.flatnonzero(magnitude >= threshold)
+        return active, threshold - np.max(magnitude, where=magnitude < threshold, initial=0)
+    active, margin = check_all()
+    drift = 0.0 # how far uniform moved since all pages were checked
+
+    for iteration in range(max_iterations):
+        if len(active) == 0:
+            break
+
+        delta = residual[active] + uniform
+        ranks[active] += delta
+        residual[active] = -uniform
+
+        # push d*delta/OB(p) to every page p links to
+        linking = ~index.dangling[active]
+        counts = index.outdegree[active[linking]]
+        firsts = np.repeat(index.outbound_indptr[active[linking]] - np.cumsum(counts) + counts, counts)
+        targets = index.targets[firsts + np.arange(counts.sum())]
+        np.add.at(residual, targets, np.repeat(d*delta[linking]/counts, counts))
+        # sinks are treated as linking to all pages in web
+        push = d*delta[~linking].sum()/N
+        uniform += push
+        drift += abs(push)
+
+        if drift >= margin:
+            active, margin = check_all()
+            drift = 0.0
+        else:
+            # only the pages pushed to changed, the others stay below the threshold while
+            # the drift is less than the margin
+            changed = np.unique(targets)
+            magnitude = np.abs(residual[changed] + uniform)
+            active = changed[magnitude >= threshold]
+            margin = min(margin, drift + threshold - np.max(magnitude, where=magnitude < threshold, initial=0))
+
+    # finish with the stopping condition of recursive_pagerank: Jacobi sweeps until the
+    # maximum change over all pageranks is less than stopvalue (usually a single one)
+    for iteration in range(iteration, max_iterations):
+        ranks, increments = vectorized_rank_update(ranks, index.sources, index.targets,
+                                                   index.outdegree, index.dangling, d)
+        if np.all(increments < stopvalue):
+            break
+
+    pageranks = dict(zip(index.pages, ranks))
+    return pageranks, iteration
+
+
+def aitken_extrapolation(x0,x1,x2):
+    '''
+    Aitken delta^2 extrapolation of three successive pagerank vectors, done for every
+    page separately. Pages where the second difference is zero keep x2.
+    '''
+    second = x2 - 2*x1 + x0
+    safe = np.abs(second) > 1e-300
+    x = x2.copy()
+    x[safe] = x0[safe] - (x1[safe] - x0[safe])**2/second[safe]
+    return x
+
+def quadratic_extrapolation(x0,x1,x2,x3):
+    '''
+    Quadratic extrapolation of four successive pagerank vectors (Kamvar et al.),
+    which assumes x0 is a combination of the first three eigenvectors and removes
+    the second and third from the newest vectors.
+    '''
+    y = np.stack([x1 - x0, x2 - x0], axis=1)
+    gamma, *_ = np.linalg.lstsq(y, -(x3 - x0), rcond=None)
+    gamma1, gamma2, gamma3 = gamma[0], gamma[1], 1.0
+    return (gamma1 + gamma2 + gamma3)*x1 + (gamma2 + gamma3)*x2 + gamma3*x3
+
+def extrapolated_pagerank(web,stopvalue,max_iterations=10000,d=0.85,extrapolation="quadratic",period=10,
+                          index=None,observer=None):
+    '''
+    Power iteration with "vectorized_rank_update" that every period iterations replaces
+    the pageranks by their Aitken ("aitken", needs period >= 2) or quadratic ("quadratic",
+    needs period >= 3) extrapolation. The extrapolation is only kept if the increment of
+    an update from it is smaller than the last one, otherwise the power iteration goes on
+    as if nothing happened, so a bad extrapolation (Aitken mostly is one for pagerank)
+    costs one update per period. That update is counted as an iteration and passed to
+    the observer like the others, so iteration is the number of updates (matvecs) - 1.
+    stopvalue, max_iterations and d are as in recursive_pagerank, index is an optional
+    prebuilt "WebIndex" of web and observer an optional Observer (see observers.py).
+    Output: (pageranks, iteration) as in recursive_pagerank
+    '''
+    # the number of pagerank vectors every extrapolation needs
+    needed = {"aitken": 3, "quadratic": 4}
+    if extrapolation not in needed:
+        raise Exception(f'unknown extrapolation {extrapolation}')
+    if period < needed[extrapolation] - 1:
+        raise Exception(f'period must be at least {needed[extrapolation] - 1} for {extrapolation}')
+
+    if observer is not None:
+        start = time.perf_counter()
+    if index is None:
+        index = WebIndex(web)
+    N = len(index.pages)
+    if observer is not None:
+        observer.phase("build", time.perf_counter() - start)
+        elapsed = 0.0
+
+    ranks = np.full(N, 1/N)
+    history = [ranks]
+    updates = 0 # plain updates since the last extrapolation
+    candidate = None # the extrapolation waiting for its check
+    for iteration in range(max_iterations):
+        if observer is not None:
+            start = time.perf_counter()
+
+        if candidate is None:
+            ranks, increments = vectorized_rank_update(ranks, index.sources, index.targets,
+                                                       index.outdegree, index.dangling, d)
+            history = history[-3:] + [ranks]
+            updates += 1
+            if updates == period:
+                if extrapolation == "aitken":
+                    candidate = aitken_extrapolation(*history[-3:])
+                else:
+                    candidate = quadratic_extrapolation(*history)
+                # the extrapolation does not keep the sum at 1
+                candidate = np.abs(candidate)
+                candidate = candidate/candidate.sum()
+        else:
+            # the check is an update of its own: the extrapolation is only kept if it
+            # brought the pageranks closer to the fixed point
+            candidate, candidate_increments = vectorized_rank_update(candidate, index.sources, index.targets,
+                                                                     index.outdegree, index.dangling, d)
+            if candidate_increments.max() < increments.max():
+                ranks, increments = candidate, candidate_increments
+            candidate = None
+            history = [ranks]
+            updates = 0
+
+        converged = np.all(increments < stopvalue)
+        if observer is not None:
+            elapsed += time.perf_counter() - start
+            if observer.iteration(iteration, increments.max(), elapsed, ranks):
+                break
+        if converged:
+            break
+
+    pageranks = dict()
+    for i, page in enumerate(index.pages):
+        pageranks[page] = ranks[i]
+    return pageranks, iteration
+
+def convergence_extrapolated_pagerank(web,true_ranking,tolerance,max_iterations,writer,d=0.85,
+                                      extrapolation="quadratic",period=10,index=None,norm="relative"):
+    '''
+    extrapolated_pagerank writing the max norm error of every iteration with writer like
+    convergence_recursive_pagerank, until the pageranks are within tolerance of true_ranking
+    in norm.
+    '''
+    if index is None:
+        index = WebIndex(web)
+    convergence = ConvergenceObserver(true_ranking, index.pages, tolerance, writer, norm)
+    pageranks, iteration = extrapolated_pagerank(web, 0, max_iterations, d, extrapolation, period,
+                                                 index, convergence)
+    if not convergence.converged:
         raise Exception('did not find anything')
 
     return pageranks, iteration
 
 
+def teleport_vector(seeds):
+    '''
+    returns the teleport distribution of personalized pagerank as a dictionary
+    seeds is a single page, a list or set of pages (teleporting evenly to them) or a
+    dictionary from pages to weights
+    '''
+    if isinstance(seeds, dict):
+        teleport = dict(seeds)
+    elif isinstance(seeds, (list, set, tuple, frozenset)):
+        teleport = {page: 1 for page in seeds}
+    else:
+        teleport = {seeds: 1}
+
+    total = sum(teleport.values())
+    for page in teleport:
+        teleport[page] /= total
+    return teleport
+
+def personalized_pagerank(web,seeds,d=0.85,epsilon=1e-4):
+    """
+    Personalized pagerank by forward push (Andersen, Chung and Lang): instead of
+    teleporting to all pages with probability 1-d, the surfer teleports to the seeds.
+    Every page has a pagerank and a residual, the rank mass not yet handed out. At the
+    start the residual is the teleport vector, and a push of page p keeps (1-d) of its
+    residual as pagerank and hands d of it evenly to the pages p links to. Pages are
+    pushed until no page has a residual of at least epsilon times its number of
+    outlinks, so only the neighbourhood of the seeds is touched, never all of web.
+    Sinks hand their residual back to the seeds, like the teleport.
+    Input: web is a dictionary as in the output of "make_web", seeds is as in the input
+           of "teleport_vector", d is the damping constant, epsilon is a positive float
+    Output: A dictionary with the pages that got a pagerank, and their pageranks.
+            The pageranks are never above the exact personalized pageranks, and
+            together they miss less than epsilon times the number of links in web.
+    """
+    teleport = teleport_vector(seeds)
+    pageranks = dict()
+    residual = dict(teleport)
+
+    def threshold(page):
+        return epsilon*max(len(web[page]), 1)
+
+    queue = deque(page for page in residual if residual[page] >= threshold(page))
+    queued = set(queue)
+    while queue:
+        page = queue.popleft()
+        queued.discard(page)
+        mass = residual.pop(page)
+        pageranks[page] = pageranks.get(page, 0) + (1-d)*mass
+
+        if len(web[page]) == 0:
+            targets = teleport
+        else:
+            share = 1/len(web[page])
+            targets = {outpage: share for outpage in web[page]}
+
+        for outpage, weight in targets.items():
+            residual[outpage] = residual.get(outpage, 0) + d*mass*weight
+            if outpage not in queued and residual[outpage] >= threshold(outpage):
+                queue.append(outpage)
+                queued.add(outpage)
+
+    return pageranks
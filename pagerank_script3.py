@@ -3,6 +3,14 @@ from pagerank_script1 import *
 from pagerank_script2 import *
 import numpy as np
 import math
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+from observers import Observer, TimingObserver
 
 def modified_link_matrix(web,pagelist,d=0.85):
     """ 
@@ -32,16 +40,147 @@ def modified_link_matrix(web,pagelist,d=0.85):
                 A[i,j] = 1/outlinks_len 
     return (d * A.T) + (1-d)*np.ones(shape=(N, N))/N
 
-def eigenvector_pagerank(web,d=0.85):
+def web_fingerprint(web):
+    """
+    Returns a hex string identifying web, the same for all webs with the same pages
+    (in the same order) and links, however their sets of links happen to be ordered.
+    The pages are hashed by value, as integers when they are integers and by repr
+    otherwise, followed by the links of every page in sorted order.
+    For integer pages this is done by numpy without a python loop over the links.
+    """
+    pages = list(web.keys())
+    N = len(pages)
+    degrees = np.fromiter(map(len, web.values()), dtype=np.int64, count=N)
+    E = int(degrees.sum())
+
+    fingerprint = hashlib.blake2b(digest_size=16)
+    values = np.asarray(pages)
+    if N > 0 and values.ndim == 1 and values.dtype.kind in 'iu':
+        fingerprint.update(values.astype('<i8').tobytes())
+        links = np.fromiter(chain.from_iterable(web.values()), dtype=np.int64, count=E)
+    else:
+        fingerprint.update(repr(pages).encode())
+        position = {page: j for j, page in enumerate(pages)}
+        links = np.fromiter((position[q] for q in chain.from_iterable(web.values())), dtype=np.int64, count=E)
+
+    # sort the links of every page, by sorting the keys row*span + link when they fit
+    rows = np.repeat(np.arange(N), degrees)
+    if E > 0:
+        low = links.min()
+        span = int(links.max()) - int(low) + 1
+        if N*span < 2**62:
+            links = np.sort(rows*span + (links - low)) - rows*span + low
+        else:
+            links = links[np.lexsort((links, rows))]
+    fingerprint.update(degrees.astype('<i8').tobytes())
+    fingerprint.update(links.astype('<i8').tobytes())
+    return fingerprint.hexdigest()
+
+class GoogleMatrix:
+    """
+    The modified link matrix M of a web for the damping factor d, built once and shared
+    by the matrix based functions (eigenvector_pagerank, matrix_pagerank, ...).
+    The sparse link structure is built right away, the dense M of modified_link_matrix
+    only the first time it is needed. Unlike modified_link_matrix the web is not changed.
+    """
+    def __init__(self, web, d=0.85, links=None):
+        self.pages = list(web.keys())
+        self.d = d
+        if links is None:
+            links = sparse_link_matrix(web, self.pages)
+        self.indptr, self.indices, self.outdegree = links
+        self.fingerprint = web_fingerprint(web)
+        self.M = None
+
+    def dense(self):
+        """ Returns the dense modified link matrix, as modified_link_matrix(web, pages, d) """
+        if self.M is None:
+            N = len(self.pages)
+            A = np.zeros(shape=(N, N))
+            rows = np.repeat(np.arange(N), self.outdegree)
+            A[rows, self.indices] = 1/self.outdegree[rows]
+            # sinks link to all pages
+            A[self.outdegree == 0, :] = 1/N
+            self.M = (self.d * A.T) + (1-self.d)*np.ones(shape=(N, N))/N
+        return self.M
+
+    def damped(self, d):
+        """ Returns the GoogleMatrix of the same web for the damping factor d, sharing the link structure """
+        operator = copy.copy(self)
+        operator.d = d
+        operator.M = None
+        return operator
+
+    def product(self, v, method="sparse"):
+        """ Returns M @ v, with the dense matrix for method "vector" or sparse_google_product for "sparse" """
+        if method == "vector":
+            return self.dense() @ v
+        elif method == "sparse":
+            return sparse_google_product(self.indptr, self.indices, self.outdegree, v, self.d)
+        raise Exception(f'unknown method {method}')
+
+class GoogleMatrixCache:
+    """
+    Least recently used cache of GoogleMatrix objects, keyed on the fingerprint of the
+    web and d, holding at most maxsize of them.
+    """
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.operators = OrderedDict()
+
+    def get(self, web, d=0.85):
+        """ Returns the GoogleMatrix of web and d, building it only if it is not cached """
+        key = (web_fingerprint(web), d)
+
+        if key in self.operators:
+            self.operators.move_to_end(key)
+        else:
+            self.operators[key] = GoogleMatrix(web, d)
+            if len(self.operators) > self.maxsize:
+                self.operators.popitem(last=False)
+        return self.operators[key]
+
+def eigenvector_pagerank(web,d=0.85,method="dense",tolerance=1e-10,max_iterations=10000,operator=None):
     """
     Returns the pagerank of web as the eigenvector of the modified link matrix
     Input: web is a dictionary of web pages and lines. 
            d is a positive float, the damping constant
+           method is "dense" to compute all eigenpairs of the full matrix with np.linalg.eig,
+           "power" to run the power method on the implicit sparse matrix (see sparse_pagerank)
+           or "arnoldi" to compute only the dominant eigenvector with the Arnoldi solver
+           of scipy on the implicit sparse matrix
+           tolerance and max_iterations are used by "power" and "arnoldi"
+           operator is an optional "GoogleMatrix" of web and d to use instead of building M
     Output: A dictionary with the same keys as web, and the values the pageranks of the keys
     """
     ranking=dict()
     pages=list(web.keys())
-    M=modified_link_matrix(web,pages,d)
+
+    if method == "power":
+        return sparse_pagerank(web, d, tolerance, max_iterations, operator)
+    elif method == "arnoldi" and len(pages) > 2:
+        from scipy.sparse.linalg import LinearOperator, eigs
+        if operator is None:
+            operator = GoogleMatrix(web, d)
+        N = len(pages)
+
+        M = LinearOperator((N, N), dtype=float, matvec=lambda x: operator.product(np.ravel(x)))
+        _, V = eigs(M, k=1, which='LM', tol=tolerance, maxiter=max_iterations, v0=np.full(N, 1/N))
+
+        # normalize the vector
+        eigvector = V[:, 0].real
+        eigvector = eigvector / sum(eigvector)
+        for i, page in enumerate(pages):
+            ranking[page] = eigvector[i]
+        return ranking
+    elif method not in ("dense", "arnoldi"):
+        # arnoldi needs more than 2 pages, smaller webs use the dense solver
+        raise Exception(f'unknown method {method}')
+
+    if operator is None:
+        M=modified_link_matrix(web,pages,d)
+    else:
+        M=operator.dense()
     lambdas, V=np.linalg.eig(M)
     eigvector = []
 
@@ -63,98 +202,395 @@ def eigenvector_pagerank(web,d=0.85):
 
     return ranking
 
-def matrix_pagerank(web,power,d=0.85):
+def matrix_vector_product(web,pagelist,d=0.85,method="vector",operator=None):
+    """
+    Returns a function computing M @ v for the modified link matrix M of web
+    Input: web is a dictionary whose keys are contained in the list pagelist,
+           pagelist is just a list of the keys (to give the keys and ordering)
+           d is the damping factor
+           method is "vector" to build the dense M with modified_link_matrix, O(N^2) per
+           product, or "sparse" to use sparse_google_product, O(E) per product
+           operator is an optional "GoogleMatrix" of web and d to use instead
+    Output: a function taking a numpy vector v and returning the numpy vector M @ v
+    """
+    if operator is not None:
+        if method not in ("vector", "sparse"):
+            raise Exception(f'unknown method {method}')
+        return lambda v: operator.product(v, method)
+    elif method == "vector":
+        M = modified_link_matrix(web, pagelist, d)
+        return lambda v: M @ v
+    elif method == "sparse":
+        indptr, indices, outdegree = sparse_link_matrix(web, pagelist)
+        return lambda v: sparse_google_product(indptr, indices, outdegree, v, d)
+    raise Exception(f'unknown method {method}')
+
+def first_column_iteration(web,pagelist,d=0.85,method="vector",operator=None):
+    """
+    Returns (product, column) where product is the function of matrix_vector_product
+    and column is the first column of M. Every product(column) gives the first column
+    of the next power of M, without ever forming the powers.
+    """
+    product = matrix_vector_product(web, pagelist, d, method, operator)
+    e_0 = np.zeros(len(pagelist))
+    e_0[0] = 1
+    return product, product(e_0)
+
+def matrix_pagerank(web,power,d=0.85,method="matrix",operator=None):
     """
     Returns the pagerank as the first column of the power'th power of the modified link matrix
 
     Input: web is a dictionary of web pages and lines. 
            d is a positive float, the damping constant
+           method is "matrix" for the power of the full matrix, or "vector" (dense) or
+           "sparse" to multiply only the first column power times, see matrix_vector_product
+           operator is an optional "GoogleMatrix" of web and d to use instead of building M
     Output: A dictionary with the same keys as web, and the values the pageranks of the keys
     """
     ranking=dict()
 
     pages=list(web.keys())
-    M=modified_link_matrix(web,pages, d)
+    if method != "matrix":
+        product = matrix_vector_product(web, pages, d, method, operator)
+        column = np.zeros(len(pages))
+        column[0] = 1
+        for _ in range(power):
+            column = product(column)
+        for i, page in enumerate(pages):
+            ranking[page] = column[i]
+        return ranking
+
+    if operator is None:
+        M=modified_link_matrix(web,pages, d)
+    else:
+        M=operator.dense()
 
     M_p = np.linalg.matrix_power(M, power)
     for i, page in enumerate(web):
         ranking[page] = M_p[:, 0][i] 
     return ranking
 
-def matrix_pagerank_iterative(web, true_ranking, max_iterations, tolerance,timer,d=0.85):
+def matrix_power_iteration(web,stopvalue,max_iterations=10000,d=0.85,method="matrix",operator=None,observer=None):
     """
-    Returns the pagerank as the first column of the power'th power of the modified link matrix
+    Returns the pagerank as the first column of the powers of the modified link matrix,
+    taking the next power until the first column changes less than stopvalue
 
     Input: web is a dictionary of web pages and lines. 
+           stopvalue is a float, iteration stops once the maximum change of the first
+           column between two powers is less than stopvalue
+           max_iterations is a positive integer, the highest power is max_iterations
            d is a positive float, the damping constant
-    Output: A dictionary with the same keys as web, and the values the pageranks of the keys
+           method is "matrix" to multiply the full matrix powers, or "vector" (dense) or
+           "sparse" to multiply only the first column, see matrix_vector_product
+           operator is an optional "GoogleMatrix" of web and d to use instead of building M
+           observer is an optional Observer (see observers.py) that gets the "build" phase
+           and every power, and can stop the iterations
+    Output: (ranking, iteration) where ranking is a dictionary with the same keys as web,
+            and the values the pageranks of the keys
     """
-    ranking=dict()
+    if observer is not None:
+        start = time.perf_counter()
     pages=list(web.keys())
-    M=modified_link_matrix(web,pages, d)
-    new_M = M
-
-    def check_ranking(mat):
-        for i, page in enumerate(web):
-            ranking[page] = mat[:, 0][i] 
-
-        for key in true_ranking:
-            if key not in ranking:
-                return False
-            elif not (math.isclose(ranking[key], true_ranking[key], rel_tol = tolerance)):
-                return False
-        return True
-
-    current_iterations = 0
-    while True:
-        timer.start()
-        current_iterations+=1
-        if current_iterations == max_iterations:
-            raise Exception('not found')
-
-        new_M = np.matmul(new_M, M)
-        timer.stop()
-        if check_ranking(new_M):
-            return ranking
-
-def matrix_pagerank_csv(web, true_ranking, max_iterations, tolerance,writer,d=0.85):
+    if method == "matrix":
+        if operator is None:
+            M=modified_link_matrix(web,pages, d)
+        else:
+            M=operator.dense()
+        new_M = M
+        column = M[:, 0]
+    else:
+        product, column = first_column_iteration(web, pages, d, method, operator)
+    if observer is not None:
+        observer.phase("build", time.perf_counter() - start)
+        elapsed = 0.0
+
+    for iteration in range(max_iterations - 1):
+        if observer is not None:
+            start = time.perf_counter()
+
+        previous = column
+        if method == "matrix":
+            new_M = np.matmul(new_M, M)
+            column = new_M[:, 0]
+        else:
+            column = product(column)
+        residual = np.max(np.abs(column - previous))
+
+        if observer is not None:
+            elapsed += time.perf_counter() - start
+            if observer.iteration(iteration, residual, elapsed, column):
+                break
+        if residual < stopvalue:
+            break
+
+    ranking=dict()
+    for i, page in enumerate(pages):
+        ranking[page] = column[i]
+    return ranking, iteration
+
+def matrix_pagerank_iterative(web, true_ranking, max_iterations, tolerance,timer,d=0.85,method="matrix",operator=None,
+                              norm="relative"):
     """
-    Returns the pagerank as the first column of the power'th power of the modified link matrix
+    Timed version of matrix_power_iteration: takes powers until the pageranks are within
+    tolerance of true_ranking in norm (see ConvergenceCheck in observers.py), with timer
+    paused while that is checked.
+    Output: A dictionary with the same keys as web, and the values the pageranks of the keys
+    """
+    convergence = ConvergenceObserver(true_ranking, list(web.keys()), tolerance, norm=norm)
+    ranking, _ = matrix_power_iteration(web, 0, max_iterations, d, method, operator,
+                                        TimerObserver(timer, convergence))
+    if not convergence.converged:
+        raise Exception('not found')
+    return ranking
 
+def matrix_pagerank_csv(web, true_ranking, max_iterations, tolerance,writer,d=0.85,method="matrix",operator=None,
+                        norm="relative"):
+    """
+    matrix_power_iteration writing the max norm error of every power with writer, until
+    the pageranks are within tolerance of true_ranking in norm.
+    Output: A dictionary with the same keys as web, and the values the pageranks of the keys
+    """
+    convergence = ConvergenceObserver(true_ranking, list(web.keys()), tolerance, writer, norm)
+    ranking, _ = matrix_power_iteration(web, 0, max_iterations, d, method, operator, convergence)
+    if not convergence.converged:
+        raise Exception('not found')
+    return ranking
+
+def sparse_google_product(indptr,indices,outdegree,rank,d=0.85):
+    """
+    Returns M @ rank, where M is the modified link matrix of modified_link_matrix,
+    without ever forming M.
+    Input: indptr, indices and outdegree are as in the output of "sparse_link_matrix",
+           rank is a numpy vector with one entry per page, d is the damping factor
+    Output: numpy vector d*A^T rank + (d*(sink mass) + (1-d)*sum(rank))/N, computed
+            in O(E) since sinks and teleportation only add the same value to every page
+    """
+    N = len(rank)
+    sinks = outdegree == 0
+
+    # every page hands rank/outdegree to each page it links to
+    share = np.divide(rank, outdegree, out=np.zeros(N), where=~sinks)
+    linked = np.bincount(indices, weights=np.repeat(share, outdegree), minlength=N)
+
+    # sinks link to all pages, and with probability 1-d we teleport anywhere
+    return d*linked + (d*rank[sinks].sum() + (1-d)*rank.sum())/N
+
+def sparse_pagerank(web,d=0.85,stopvalue=1e-10,max_iterations=10000,operator=None,observer=None,initial=None):
+    """
+    Returns the pagerank of web by power iteration on the sparse link structure
     Input: web is a dictionary of web pages and lines. 
            d is a positive float, the damping constant
+           stopvalue is a positive float, iteration stops once the maximum change
+           of any pagerank between two steps is less than stopvalue
+           max_iterations is a positive integer
+           operator is an optional "GoogleMatrix" of web and d to use its link structure
+           observer is an optional Observer (see observers.py) that gets the "build"
+           phase and every iteration, and can stop the iterations
+           initial is an optional numpy vector of pageranks in the order of web to start
+           from, default 1/N for every page
     Output: A dictionary with the same keys as web, and the values the pageranks of the keys
     """
-    ranking=dict() #convert to dictionary
+    if observer is not None:
+        start = time.perf_counter()
+    ranking=dict()
+    pages=list(web.keys())
+    if operator is None:
+        operator = GoogleMatrix(web, d)
+    if observer is not None:
+        observer.phase("build", time.perf_counter() - start)
+        elapsed = 0.0
+
+    rank = np.full(len(pages), 1/len(pages)) if initial is None else initial
+    for iteration in range(max_iterations):
+        if observer is not None:
+            start = time.perf_counter()
+        new_rank = operator.product(rank)
+        increment = np.max(np.abs(new_rank - rank))
+        rank = new_rank
+        if observer is not None:
+            elapsed += time.perf_counter() - start
+            if observer.iteration(iteration, increment, elapsed, rank):
+                break
+        if increment < stopvalue:
+            break
+
+    # assign the ranking to each page
+    for i, page in enumerate(pages):
+        ranking[page] = rank[i]
+
+    return ranking
+
+def sparse_block_product(index,ranks,max_entries=2**22):
+    """
+    Returns A^T D^-1 ranks for a block of rank vectors, the link part of the modified
+    link matrix without the sinks and teleportation.
+    Input: index is a "WebIndex", ranks is an N x K numpy array with a rank vector per column
+           max_entries bounds the link/column pairs whose shares are held at once: the
+           pages are done in ranges of about max_entries/K inbound links (a range has at
+           least one page), so the memory does not grow with E*K
+    Output: N x K numpy array where row j is the sum of ranks[q]/OB(q) over pages q linking to j
+    """
+    sources = index.inbound_sources
+    indptr = index.inbound_indptr
+    N, K = ranks.shape
+    step = max(max_entries // max(K, 1), 1)
+
+    product = np.zeros(ranks.shape)
+    lo = 0
+    while lo < N:
+        hi = max(int(np.searchsorted(indptr, indptr[lo] + step, side='right')) - 1, lo + 1)
+        first, last = indptr[lo], indptr[hi]
+        if last > first:
+            shares = ranks[sources[first:last]]/np.maximum(index.outdegree[sources[first:last]], 1)[:, None]
+            # add up the consecutive inbound links of every page of the range that has any
+            linked = np.flatnonzero(indptr[lo+1:hi+1] > indptr[lo:hi])
+            product[lo + linked] = np.add.reduceat(shares, indptr[lo:hi][linked] - first, axis=0)
+        lo = hi
+    return product
+
+def batched_personalized_pagerank(web,seeds_list,d=0.85,stopvalue=1e-10,max_iterations=1000,
+                                  threads=None,block_size=None,index=None):
+    """
+    Personalized pagerank for many seeds at once, by power iteration on an N x K block
+    with a column for every query, so every pass over the links advances all queries.
+    Like personalized_pagerank the surfer teleports to the seeds, and sinks link to them.
+    Input: web is a dictionary of web pages and links, seeds_list is a list of K seeds
+           as in the input of "teleport_vector", d is the damping constant,
+           stopvalue and max_iterations are as in recursive_pagerank for every column,
+           threads is the number of threads for blocks of block_size columns
+           (default: one block in the calling thread), index is an optional "WebIndex"
+    Output: (ranks, converged) where ranks is an N x K numpy array with the pageranks of
+            the pages in the order of web in column k for seeds_list[k], and converged
+            is a boolean numpy vector telling which columns reached the stopvalue
+    """
+    if index is None:
+        index = WebIndex(web)
+    N, K = len(index.pages), len(seeds_list)
+
+    teleport = np.zeros((N, K))
+    for k, seeds in enumerate(seeds_list):
+        for page, weight in teleport_vector(seeds).items():
+            teleport[index.ids[page], k] = weight
+
+    ranks = teleport.copy()
+    converged = np.zeros(K, dtype=bool)
+
+    def iterate(columns):
+        # the columns are taken out of the block once they have converged
+        active = columns
+        for iteration in range(max_iterations):
+            block = ranks[:, active]
+            sinkmass = block[index.dangling].sum(axis=0)
+            newblock = d*sparse_block_product(index, block) + (1 - d + d*sinkmass)*teleport[:, active]
+
+            ranks[:, active] = newblock
+            done = np.max(np.abs(newblock - block), axis=0) < stopvalue
+            converged[active[done]] = True
+            active = active[~done]
+            if len(active) == 0:
+                break
+
+    if block_size is None:
+        block_size = K if threads is None else -(-K // threads)
+    blocks = [np.arange(start, min(start + block_size, K)) for start in range(0, K, max(block_size, 1))]
+    if threads is None:
+        for columns in blocks:
+            iterate(columns)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(iterate, blocks))
 
+    return ranks, converged
+
+def damping_sweep_pagerank(web,damping_factors,stopvalue=1e-10,max_iterations=10000):
+    """
+    Returns the pagerank of web for several damping factors with sparse_pagerank, on
+    one GoogleMatrix whose link structure is built only once. The damping factors are
+    solved from the smallest up, and each starts the power iteration from the pageranks
+    of the previous ones (extrapolated linearly in d once there are two), which is much
+    closer than 1/N.
+    Input: web is a dictionary of web pages and lines.
+           damping_factors is a list of damping constants
+           stopvalue and max_iterations are as in sparse_pagerank, for every damping factor
+    Output: A dictionary from every damping factor to (ranking, iterations), where ranking
+            is a dictionary with the same keys as web and the pageranks as values
+    """
     pages=list(web.keys())
-    M=modified_link_matrix(web,pages, d)
-    new_M = M
-    true_vec = get_vector(true_ranking)
-
-    def check_ranking(mat):
-        for i, page in enumerate(web):
-            ranking[page] = mat[:, 0][i] 
-
-        curr_rank = get_vector(ranking)
-        max_matrix_norm = np.max(np.abs(true_vec - curr_rank))
-        writer.writerow([str(max_matrix_norm)])
-
-        for key in true_ranking:
-            if key not in ranking:
-                return False
-            elif not (math.isclose(ranking[key], true_ranking[key], rel_tol = tolerance)):
-                return False
-        return True
-    current_iterations = 0
-    while True:
-        current_iterations+=1
-        if current_iterations == max_iterations:
-            raise Exception('not found')
-
-        new_M = np.matmul(new_M, M)
-        if check_ranking(new_M):
-            return ranking
+    operator = GoogleMatrix(web)
+
+    results = dict()
+    solved = [] # (d, rank) of the damping factors done so far
+    for d in sorted(set(damping_factors)):
+        if len(solved) == 0:
+            rank = None
+        elif len(solved) == 1:
+            rank = solved[-1][1]
+        else:
+            # extrapolate linearly in d from the last two solutions
+            (d1, rank1), (d2, rank2) = solved[-2:]
+            rank = rank2 + (d - d2)/(d2 - d1)*(rank2 - rank1)
+            rank = np.maximum(rank, 0)
+            rank = rank/rank.sum()
+
+        timing = TimingObserver()
+        ranking = sparse_pagerank(web, d, stopvalue, max_iterations, operator.damped(d), timing, rank)
+        solved.append((d, np.fromiter(ranking.values(), dtype=float, count=len(pages))))
+        results[d] = (ranking, timing.iterations[-1][0])
+
+    return results
+
+class TopKObserver(Observer):
+    '''
+    Stops the power iteration of sparse_pagerank once the order of the k highest
+    pageranks is certain (see top_k_pagerank) or the bound is below stopvalue.
+    candidates are the ids of the k+1 highest pageranks of the last iteration, sorted.
+    '''
+    def __init__(self, k, d, stopvalue):
+        self.k = k
+        self.d = d
+        self.stopvalue = stopvalue
+        self.previous = None
+        self.candidates = None
+        self.last = None
+
+    def iteration(self, iteration, residual, elapsed, ranks):
+        self.last = iteration
+        N = len(ranks)
+        previous = np.full(N, 1/N) if self.previous is None else self.previous
+        bound = self.d*np.sum(np.abs(ranks - previous))/(1-self.d)
+        self.previous = ranks.copy()
+
+        # the k+1 highest pageranks, sorted
+        highest = min(self.k+1, N)
+        candidates = np.argpartition(-ranks, highest-1)[:highest]
+        self.candidates = candidates[np.argsort(-ranks[candidates], kind='stable')]
+        gaps = -np.diff(ranks[self.candidates])
+        return bound < self.stopvalue or np.all(gaps > bound)
+
+def top_k_pagerank(web,k,d=0.85,stopvalue=1e-12,max_iterations=10000):
+    """
+    Returns the k pages with the highest pagerank, stopping the power iteration as soon
+    as their order is certain instead of waiting for all pageranks to converge.
+    After a step with change delta (in the sum of absolute changes), no pagerank is
+    further than d*delta/(1-d) from its exact value, and two pageranks together are no
+    further than that. So when the gaps between the k+1 highest pageranks are all larger
+    than this bound, neither the top k pages nor their order can change any more.
+    Input: web is a dictionary of web pages and lines, k is a positive integer,
+           d is a positive float, the damping constant
+           stopvalue is a positive float, iteration also stops once the bound is below
+           it (needed when pages have the same pagerank), max_iterations is a positive integer
+    Output: (top, iteration) where top is a list of (page, pagerank) sorted from the highest
+            pagerank, and iteration is the number of iterations used
+    """
+    pages=list(web.keys())
+    k = min(k, len(pages))
+
+    # the observer stops the iterations, so the stopvalue of sparse_pagerank is never reached
+    topk = TopKObserver(k, d, stopvalue)
+    ranking = sparse_pagerank(web, d, 0, max_iterations, observer=topk)
+
+    top = [(pages[i], ranking[pages[i]]) for i in topk.candidates[:k]]
+    return top, topk.last
 
 # # test the function modified_link_matrix
 web={1: {2}, 2: {3}, 3: {}}
@@ -242,3 +678,27 @@ M = modified_link_matrix(web, list(web.keys()), 1)
 
 
 
+
+
+# # Check random_surf_vectorized against eigenvector_pagerank, the difference is
+# # only the sampling error, about 1/sqrt(n)
+# web1={0: {1, 3}, 1: {0}, 2: {0}, 3: {0}}
+# web2={0: {9, 5}, 1: {0, 8, 4}, 2: set(), 3: set(), 4: {1}, 5: {0, 9, 2}, \
+#         6: set(), 7: set(), 8: {6}, 9: {0, 1, 4}}
+# for web, n in ((web1, 100000), (web2, 500000)):
+#     ranking1 = random_surf_vectorized(web, n, seed=0)
+#     ranking2 = eigenvector_pagerank(web)
+#     print_rank(ranking1)
+#     print_rank(ranking2)
+#     print(max(abs(ranking1[page] - ranking2[page]) for page in web))
+# """
+# Expected output:
+# 0:  0.4793,  1:  0.241,  2:  0.0379,  3:  0.2419,
+# 0:  0.4797,  1:  0.2414,  2:  0.0375,  3:  0.2414,
+# 0.0005
+# 0:  0.1494,  1:  0.1746,  2:  0.0637,  3:  0.0357,  4:  0.1213,  5:  0.0992,
+#     6:  0.108,  7:  0.0355,  8:  0.0855,  9:  0.1271,
+# 0:  0.1493,  1:  0.1748,  2:  0.0638,  3:  0.0357,  4:  0.1212,  5:  0.0991,
+#     6:  0.1081,  7:  0.0357,  8:  0.0852,  9:  0.1272,
+# 0.0003
+# """
@@ -1,7 +1,8 @@
 
 CSV_FILENAME = 'timecalc2.csv'
 
-HEADERS = ["nodes", "connections", "eig_vector", "recursive", "iterative_matrix"]
+HEADERS = ["nodes", "connections", "eig_vector", "recursive", "iterative_matrix",
+           "recursive_build", "matrix_build"]
 
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -11,7 +12,10 @@ def plot_csv_lines(csv_filename):
 
     x = df['nodes']
     
-    columns_to_plot = ['eig_vector', 'recursive', "iterative_matrix"]
+    # every column but the web sizes and the build phases (of timecalc.py) is a method,
+    # as written by timecalc.py or benchmark.py
+    columns_to_plot = [col for col in df.columns
+                       if col not in ('nodes', 'connections') and not col.endswith('_build')]
 
     plt.figure(figsize=(8, 5))
     
@@ -19,9 +19,11 @@ import matplotlib.pyplot as plt
 # File names
 CSV_FILENAME_RECURSIVE = 'recursive.csv'
 CSV_FILENAME_MATRIX = 'matrix.csv'
+CSV_FILENAME_EXTRAPOLATED = 'extrapolated.csv'
 
 data_recursive = pd.read_csv(CSV_FILENAME_RECURSIVE, header=None, names=['Max Norm Difference'])
 data_matrix = pd.read_csv(CSV_FILENAME_MATRIX, header=None, names=['Max Norm Difference'])
+data_extrapolated = pd.read_csv(CSV_FILENAME_EXTRAPOLATED, header=None, names=['Max Norm Difference'])
 
 plt.figure(figsize=(10, 6))
 
@@ -31,6 +33,9 @@ plt.plot(data_recursive.index, data_recursive['Max Norm Difference'],
 plt.plot(data_matrix.index, data_matrix['Max Norm Difference'], 
          marker='s', linestyle='--', label='Iterative Matrix')
 
+plt.plot(data_extrapolated.index, data_extrapolated['Max Norm Difference'], 
+         marker='^', linestyle=':', label='Quadratic Extrapolation')
+
 plt.xlabel('Iterations')
 plt.ylabel('Max Norm Difference')
 plt.title('PageRank Convergence to 0.1% d=0.5\nCalculated on DTU HPC')
@@ -5,6 +5,8 @@ from pagerank_script3 import *
 import time
 import csv
 
+from observers import ConvergenceObserver, ObserverGroup, TimingObserver
+
 class Timer:
     def __init__(self):
         self.start_time = None
@@ -33,7 +35,8 @@ class Timer:
 
 CSV_FILENAME = 'timecalc2.csv'
 
-HEADERS = ["nodes", "connections", "eig_vector", "recursive", "iterative_matrix"]
+HEADERS = ["nodes", "connections", "eig_vector", "recursive", "iterative_matrix",
+           "recursive_build", "matrix_build"]
 
 def generate_time_calc(d, number_of_graphs):
 
@@ -53,24 +56,42 @@ def generate_time_calc(d, number_of_graphs):
             print(f'{i} out of {number_of_graphs}')
             # generate the web
             web = make_web(i,CONNECTIONS-1)
+            # let the sinks link to all pages up front, as modified_link_matrix would
+            fix_zero_columns(web)
 
             timer = Timer()
 
+            # the modified link matrix is built once and shared by the methods, every
+            # web is used only once so its operator is not kept after the web is done.
+            # Its build is timed on its own and added to both matrix methods, so their
+            # times are totals like the recursive one
+            timer.start()
+            operator = GoogleMatrix(web, d)
+            operator.dense()
+            timer.stop()
+            matrix_build = timer.get_elapsed_time()
+            timer.reset()
+
             timer.start()
-            true_ranking = eigenvector_pagerank(web, d)
+            true_ranking = eigenvector_pagerank(web, d, operator=operator)
         
             timer.stop()
             # print(true_ranking)
 
-            eig_time = timer.get_elapsed_time()
+            eig_time = matrix_build + timer.get_elapsed_time()
             timer.reset()
 
 
-            timer.start()
-            recursive_rating = recursive_pagerank_timed(web, true_ranking, TOLERANCE, MAX_ITERATIONS, timer, d) 
-            timer.stop()
-            recursive_time = timer.get_elapsed_time()
-            timer.reset()
+            # the solvers report their own build and iteration times, without the
+            # convergence checks, to a TimingObserver
+            timing = TimingObserver()
+            convergence = ConvergenceObserver(true_ranking, list(web.keys()), TOLERANCE)
+            recursive_rating, _ = recursive_pagerank(web, 0, MAX_ITERATIONS, d,
+                                                     observer=ObserverGroup(timing, convergence))
+            if not convergence.converged:
+                raise Exception('did not find anything')
+            recursive_build = timing.phases["build"]
+            recursive_time = timing.total_time()
             # print(recursive_rating)
 
             # timer.start()
@@ -80,13 +101,17 @@ def generate_time_calc(d, number_of_graphs):
             # timer.reset()
             # print(sample_rating)
 
-            timer.start()
-            matrix_iterative_power = matrix_pagerank_iterative(web, true_ranking, MAX_ITERATIONS, TOLERANCE, timer,d)
-            timer.stop()
-            matrix_iterative_time = timer.get_elapsed_time()
+            timing = TimingObserver()
+            convergence = ConvergenceObserver(true_ranking, list(web.keys()), TOLERANCE)
+            matrix_iterative_power, _ = matrix_power_iteration(web, 0, MAX_ITERATIONS, d, operator=operator,
+                                                               observer=ObserverGroup(timing, convergence))
+            if not convergence.converged:
+                raise Exception('not found')
+            matrix_iterative_time = matrix_build + timing.total_time()
             # print(matrix_iterative_power)
 
-            writer.writerow([i, CONNECTIONS-1, eig_time, recursive_time, matrix_iterative_time])
+            writer.writerow([i, CONNECTIONS-1, eig_time, recursive_time, matrix_iterative_time,
+                             recursive_build, matrix_build])
     finally:
         file.close()
     
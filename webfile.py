@@ -0,0 +1,92 @@
+"""
+Compact binary file format for webs, so a web only has to be made once.
+
+A file holds a 40 byte header followed by three arrays:
+    header:  magic b'PRWEB001', the byte size of a link target (4 or 8), N, E and
+             a crc32 checksum of the arrays, all as little endian uint64
+    pages:   int64[N], the page of every page id
+    indptr:  int64[N+1], page id j links to indices[indptr[j]:indptr[j+1]]
+    indices: int32[E] or int64[E], the page ids linked to
+which is the CSR form of "sparse_link_matrix".
+"""
+import zlib
+
+import numpy as np
+
+from pagerank_script1 import sparse_link_matrix
+
+MAGIC = b'PRWEB001'
+HEADER = np.dtype([('magic', 'S8'), ('index_bytes', '<u8'), ('N', '<u8'), ('E', '<u8'), ('checksum', '<u8')])
+
+def save_web(web,filename):
+    """
+    Writes web to filename in the binary format above.
+    Input: web is a dictionary as in the output of "make_web", the pages must be integers
+    """
+    pages = list(web.keys())
+    indptr, indices, outdegree = sparse_link_matrix(web, pages)
+    N, E = len(pages), len(indices)
+
+    # the link targets are page ids, 4 bytes are enough for most webs
+    index_dtype = '<i4' if N < 2**31 else '<i8'
+    arrays = [np.array(pages, dtype='<i8'), indptr.astype('<i8'), indices.astype(index_dtype)]
+
+    checksum = 0
+    for array in arrays:
+        checksum = zlib.crc32(array, checksum)
+
+    header = np.array([(MAGIC, np.dtype(index_dtype).itemsize, N, E, checksum)], dtype=HEADER)
+    with open(filename, 'wb') as file:
+        file.write(header.tobytes())
+        for array in arrays:
+            file.write(array.tobytes())
+
+def load_web(filename,verify=False):
+    """
+    Reads a web written by "save_web". The arrays are memory mapped, not read, so
+    loading takes the same time for any size of web.
+    Input: filename is the file, verify=True reads all arrays to check the checksum
+    Output: (pages, indptr, indices, outdegree) where pages[j] is the page with id j and
+            indptr, indices and outdegree are as in the output of "sparse_link_matrix"
+    """
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if len(header) == 0 or header['magic'][0] != MAGIC:
+        raise Exception(f'{filename} is not a web file')
+    index_bytes, N, E, checksum = (int(header[field][0]) for field in ('index_bytes', 'N', 'E', 'checksum'))
+
+    offset = HEADER.itemsize
+    arrays = []
+    for dtype, length in (('<i8', N), ('<i8', N+1), (f'<i{index_bytes}', E)):
+        if length == 0:
+            # empty arrays can not be memory mapped
+            arrays.append(np.empty(0, dtype=dtype))
+        else:
+            arrays.append(np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(length,)))
+        offset += length*np.dtype(dtype).itemsize
+    pages, indptr, indices = arrays
+
+    if verify:
+        calculated = 0
+        for array in arrays:
+            calculated = zlib.crc32(array, calculated)
+        if calculated != checksum:
+            raise Exception(f'checksum of {filename} does not match')
+
+    return pages, indptr, indices, np.diff(indptr)
+
+def csr_to_web(pages,indptr,indices):
+    """
+    Converts the CSR form of "load_web" back to a dictionary as in the output of
+    "make_web", so all the other functions can use it.
+    """
+    web = dict()
+    for j, page in enumerate(pages.tolist()):
+        web[page] = set(pages[indices[indptr[j]:indptr[j+1]]].tolist())
+    return web
+
+def read_web(filename,verify=False):
+    """
+    Reads a web written by "save_web" as a dictionary like the output of "make_web"
+    """
+    pages, indptr, indices, outdegree = load_web(filename, verify)
+    return csr_to_web(pages, indptr, indices)